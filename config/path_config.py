@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 from pathlib import Path
+import hashlib
 import os
 
 load_dotenv()
@@ -10,6 +11,16 @@ AUTH = "config/auth"
 
 AUTH_TWITTER = BASE_DIR / "config" / "auth" / "twitter_auth.json"
 
+# Local state that must survive flow runs (mounted from ./data/from_prefect in the worker)
+LOCAL_STATE = BASE_DIR / DATA / "from_prefect"
+CLASSIFICATION_CACHE = LOCAL_STATE / "cache" / "classification_cache.sqlite3"
+TAXONOMY_STORE = LOCAL_STATE / "cache" / "taxonomy.json"
+TAG_SCHEDULE = LOCAL_STATE / "scheduler" / "tag_schedule.json"
+# Progress of long flow runs (checkpoint.py), one directory per flow
+RUN_CHECKPOINTS = LOCAL_STATE / "checkpoints"
+# Persisted Prefect task results reused across flow runs (task_cache.py)
+TASK_RESULTS = LOCAL_STATE / "cache" / "task_results"
+
 repo_name = "tweets-repo"
 repo_name_ml = "tweets-repo-wordcloud"
 repo_name_hash = "hash"
@@ -19,10 +30,26 @@ branch_name = "main"
 path = "tweets.parquet"
 path_ml = "tweets_wordcloud.parquet"
 path_hash = "latest_hash.md5"
+path_ml_counts = "tweets_wordcloud_counts.parquet"
+path_tag_counts = "tweets_tag_counts.parquet"
+path_catalog = "tweets_catalog.json"
 
 lakefs_s3_path = f"s3://{repo_name}/{branch_name}/{path}"
 lakefs_s3_path_ml = f"s3://{repo_name_ml}/{branch_name}/{path_ml}"
 lakefs_s3_path_hash = f"s3://{repo_name_hash}/{branch_name}/{path_hash}"
+# One hash object per tag, so each tag's scrape is checked for changes on its own
+lakefs_s3_path_hash_tags = f"s3://{repo_name_hash}/{branch_name}/tags"
+
+def tag_hash_path(tag: str) -> str:
+    # tags are Thai or carry '#', so the object name is a digest of the tag
+    return f"{lakefs_s3_path_hash_tags}/{hashlib.md5(tag.encode('utf-8')).hexdigest()}.md5"
+
+# Pre-counted topic/subtopic labels per tag and 15-minute bucket, built from lakefs_s3_path_ml
+lakefs_s3_path_ml_counts = f"s3://{repo_name_ml}/{branch_name}/{path_ml_counts}"
+# Tweets per tag and 15-minute bucket, the rollup behind the dashboard time series
+lakefs_s3_path_tag_counts = f"s3://{repo_name}/{branch_name}/{path_tag_counts}"
+# Catalog manifest of the tweet table (tags, time range, rows per partition), rewritten on every load
+lakefs_s3_path_catalog = f"s3://{repo_name}/{branch_name}/{path_catalog}"
 
 tags = {
     "ธรรมศาสตร์": [
@@ -0,0 +1,88 @@
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+# Catalog manifest of the tweet table: everything the dashboard form and the flows need to know
+# about the dataset without scanning it. Written next to the table on every load; an
+# incremental load reads back the day partitions it wrote and merges their stats into the
+# previous manifest, replacing what it said about those days, so a retried load that finds
+# its rows already stored still leaves a correct manifest.
+#
+# SCHEMA_VERSION is the version of the tweet table's layout; bump it when columns change
+# (2: tweet_id added) so readers can tell which layout the stored files follow.
+SCHEMA_VERSION = 2
+
+
+def partition_key(year: int, month: int, day: int) -> str:
+    return f"year={int(year)}/month={int(month)}/day={int(day)}"
+
+
+def build_catalog(data: pd.DataFrame) -> dict:
+    times = pd.to_datetime(data["postTimeRaw"])
+    partitions = data.groupby(["year", "month", "day"], observed=True).size()
+    partition_tags = data.groupby(["year", "month", "day", "tag"], observed=True).size()
+    tag_stats = data.assign(postTimeRaw=times).groupby("tag", observed=True)["postTimeRaw"].agg(["size", "min", "max"])
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "updated": datetime.now().isoformat(timespec="seconds"),
+        "rows": int(len(data)),
+        "min_time": times.min().isoformat() if len(data) else None,
+        "max_time": times.max().isoformat() if len(data) else None,
+        "tags": sorted(data["tag"].dropna().unique().tolist()),
+        "categories": sorted(data["category"].dropna().unique().tolist()) if "category" in data.columns else [],
+        "partitions": {partition_key(*key): int(rows) for key, rows in partitions.items()},
+        # rows per tag in each partition, so a partition's stats can be replaced on merge
+        "partition_tags": {
+            partition_key(*key): {tag: int(rows) for tag, rows in group.droplevel([0, 1, 2]).items()}
+            for key, group in partition_tags.groupby(level=[0, 1, 2])
+        },
+        "tag_stats": {
+            tag: {"rows": int(row["size"]), "min_time": row["min"].isoformat(), "max_time": row["max"].isoformat()}
+            for tag, row in tag_stats.iterrows()
+        },
+    }
+
+
+def merge_catalog(catalog: Optional[dict], delta: dict) -> dict:
+    # delta describes whole partitions: their counts replace the catalog's, time ranges widen,
+    # tag and category lists are unions. Applying the same delta twice changes nothing.
+    if not catalog:
+        return delta
+
+    def widen(a: Optional[str], b: Optional[str], pick) -> Optional[str]:
+        values = [value for value in (a, b) if value]
+        return pick(values, key=pd.Timestamp) if values else None
+
+    partitions = {**catalog.get("partitions", {}), **delta["partitions"]}
+    partition_tags = {**catalog.get("partition_tags", {}), **delta["partition_tags"]}
+    tag_rows = Counter()
+    for rows_by_tag in partition_tags.values():
+        tag_rows.update(rows_by_tag)
+    tag_stats = {}
+    for tag, rows in tag_rows.items():
+        old = catalog.get("tag_stats", {}).get(tag, {})
+        new = delta["tag_stats"].get(tag, {})
+        tag_stats[tag] = {
+            "rows": rows,
+            "min_time": widen(old.get("min_time"), new.get("min_time"), min),
+            "max_time": widen(old.get("max_time"), new.get("max_time"), max),
+        }
+    return {
+        "schema_version": delta["schema_version"],
+        "updated": delta["updated"],
+        "rows": sum(partitions.values()),
+        "min_time": widen(catalog.get("min_time"), delta["min_time"], min),
+        "max_time": widen(catalog.get("max_time"), delta["max_time"], max),
+        "tags": sorted(set(catalog.get("tags", [])) | set(delta["tags"])),
+        "categories": sorted(set(catalog.get("categories", [])) | set(delta["categories"])),
+        "partitions": dict(sorted(partitions.items())),
+        "partition_tags": dict(sorted(partition_tags.items())),
+        "tag_stats": dict(sorted(tag_stats.items())),
+    }
+
+
+def data_partitions(data: pd.DataFrame) -> list[str]:
+    # partition keys of every day this batch has rows in
+    return sorted({partition_key(*key) for key in data[["year", "month", "day"]].drop_duplicates().itertuples(index=False)})
@@ -7,12 +7,17 @@ from dotenv import load_dotenv
 import os
 import shutil
 import hashlib
+import json
+import threading
 import fsspec
+from typing import Optional
+import pyarrow as pa
+import pyarrow.dataset as ds
 
 # Import modern log configuration
 from config.logging.modern_log import LoggingConfig
 # Import path configuration
-from config.path_config import lakefs_s3_path, repo_name, branch_name, lakefs_s3_path_hash, repo_name_hash
+from config.path_config import lakefs_s3_path, repo_name, branch_name, lakefs_s3_path_hash, repo_name_hash, lakefs_s3_path_ml_counts, lakefs_s3_path_catalog
 
 logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger(__name__)
 
@@ -21,8 +26,16 @@ load_dotenv()
 import time  # <-- เพิ่มสำหรับ sleep
 
 class LakeFSLoader:
+    # the container is restarted by the first loader of a process only; flows create a loader
+    # per task and the pipeline stages run tasks side by side
+    container_restarted = False
+    _restart_lock = threading.Lock()
+
     def __init__(self, host: str = "http://localhost:8001"):
-        self.restart_container()
+        with LakeFSLoader._restart_lock:
+            if not LakeFSLoader.container_restarted:
+                self.restart_container()
+                LakeFSLoader.container_restarted = True
         self.client = Client(
             host=host,
             username=os.getenv("ACCESS_KEY"),  
@@ -51,7 +64,14 @@ class LakeFSLoader:
             f.write(hash_text)   
         logger.info(f"Uploaded hash: {hash_text} to {lakefs_s3_path_hash}")
 
-    def check_hash(self, df: pd.DataFrame, lakefs_endpoint: str) -> bool:
+    @staticmethod
+    def data_hash(df: pd.DataFrame) -> str:
+        columns = ["postTimeRaw", "username", "tweetText"]
+        data_str = df[columns].astype(str).apply(lambda row: "_".join(row), axis=1).str.cat()
+        return hashlib.md5(data_str.encode()).hexdigest()
+
+    def check_hash(self, df: pd.DataFrame, lakefs_endpoint: str, lakefs_s3_path_hash: str = lakefs_s3_path_hash, save: bool = True) -> bool:
+        # save=False only compares: the caller writes the hash with save_hash once the data is stored
         storage_options = {
             "key": os.getenv("ACCESS_KEY"),
             "secret": os.getenv("SECRET_KEY"),
@@ -59,9 +79,7 @@ class LakeFSLoader:
                 "endpoint_url": lakefs_endpoint
             }
         }
-        columns = ["postTimeRaw", "username", "tweetText"]
-        data_str = df[columns].astype(str).apply(lambda row: "_".join(row), axis=1).str.cat()
-        new_hash = hashlib.md5(data_str.encode()).hexdigest()
+        new_hash = self.data_hash(df)
 
         fs = fsspec.filesystem("s3", **storage_options)
 
@@ -72,10 +90,23 @@ class LakeFSLoader:
                 logger.info("No changes detected. Hash matched.")
                 return False 
 
+        if save:
+            self.save_hash(df, lakefs_endpoint=lakefs_endpoint, lakefs_s3_path_hash=lakefs_s3_path_hash)
+        return True  
+
+    def save_hash(self, df: pd.DataFrame, lakefs_endpoint: str, lakefs_s3_path_hash: str = lakefs_s3_path_hash) -> None:
+        storage_options = {
+            "key": os.getenv("ACCESS_KEY"),
+            "secret": os.getenv("SECRET_KEY"),
+            "client_kwargs": {
+                "endpoint_url": lakefs_endpoint
+            }
+        }
+        new_hash = self.data_hash(df)
+        fs = fsspec.filesystem("s3", **storage_options)
         with fs.open(lakefs_s3_path_hash, "w") as f:
             f.write(new_hash)
         logger.info(f"Uploaded new hash: {new_hash} to {lakefs_s3_path_hash}")
-        return True  
     
     def restart_container(self, container_name="lakefs_db"):
         try:
@@ -140,7 +171,13 @@ class LakeFSLoader:
         )
         logger.info(f"Data uploaded successfully to {lakefs_s3_path} with {len(valid_data)} records.")
 
-    def incremental_load(self, data: pd.DataFrame, lakefs_endpoint: str, lakefs_s3_path: str = lakefs_s3_path, is_wordcloud: bool=False) -> None:
+    def create_repository(self, repo_name: str = repo_name) -> None:
+        lakefs.repository(repo_name, client=self.client).create(storage_namespace=f"local://{repo_name}")
+        logger.info(f"Repository {repo_name} created or already exists.")
+
+    def load_partition(self, data: pd.DataFrame, lakefs_endpoint: str, run_id: str, lakefs_s3_path: str = lakefs_s3_path) -> None:
+        # files are named after run_id instead of a random uuid, so writing a partition again in
+        # the same run replaces what an interrupted write left behind instead of adding a copy
         storage_options = {
             "key": os.getenv("ACCESS_KEY"),
             "secret": os.getenv("SECRET_KEY"),
@@ -148,29 +185,38 @@ class LakeFSLoader:
                 "endpoint_url": lakefs_endpoint
             }
         }
-        data_in_lakefs = pd.read_parquet(
+        data.to_parquet(
             lakefs_s3_path,
             storage_options=storage_options,
+            partition_cols=['year', 'month', 'day'],
             engine='pyarrow',
+            basename_template=f"{run_id}-{{i}}.parquet",
         )
-        if is_wordcloud:
-            new_unique_data = data.merge(
-                data_in_lakefs,
-                on=["postTimeRaw", "tweetText"],    
-                how="left",
-                indicator=True
-            ).query('_merge == "left_only"').drop(columns=['_merge'])
-        else:
-            new_unique_data = data.merge(
-                data_in_lakefs,
-                on=["postTimeRaw", "username", "tweetText"],    
-                how="left",
-                indicator=True
-            ).query('_merge == "left_only"').drop(columns=['_merge'])
+        logger.info(f"Partition uploaded to {lakefs_s3_path} with {len(data)} records.")
 
-        cols = [col for col in new_unique_data.columns if not col.endswith('_y')]
-        new_cleaned_df = new_unique_data[cols].copy()
-        new_cleaned_df.columns = [col.replace('_x', '') for col in new_cleaned_df.columns]
+    def incremental_load(self, data: pd.DataFrame, lakefs_endpoint: str, lakefs_s3_path: str = lakefs_s3_path, is_wordcloud: bool=False, partitions: Optional[list[str]] = None) -> pd.DataFrame:
+        storage_options = {
+            "key": os.getenv("ACCESS_KEY"),
+            "secret": os.getenv("SECRET_KEY"),
+            "client_kwargs": {
+                "endpoint_url": lakefs_endpoint
+            }
+        }
+        # rows written before tweet_id existed are matched on the old composite key
+        legacy_keys = ["postTimeRaw", "tweetText"] if is_wordcloud else ["postTimeRaw", "username", "tweetText"]
+        # a tweet always lands in the partition of its post time, so only the partitions of
+        # this batch can hold its duplicates
+        keys_in_lakefs = self.read_columns(lakefs_endpoint, lakefs_s3_path, ["tweet_id"] + legacy_keys, partitions=partitions)
+        if keys_in_lakefs.empty:
+            new_cleaned_df = data
+        elif "tweet_id" in data.columns and "tweet_id" in keys_in_lakefs.columns:
+            has_id = keys_in_lakefs["tweet_id"].notna()
+            ids_in_lakefs = keys_in_lakefs.loc[has_id, ["tweet_id"]].astype("int64")
+            new_cleaned_df = self.anti_join(data, ids_in_lakefs, ["tweet_id"])
+            if not has_id.all():
+                new_cleaned_df = self.anti_join(new_cleaned_df, keys_in_lakefs.loc[~has_id, legacy_keys], legacy_keys)
+        else:
+            new_cleaned_df = self.anti_join(data, keys_in_lakefs, legacy_keys)
 
         if len(new_cleaned_df) > 0:
             logger.info(new_cleaned_df)
@@ -185,6 +231,139 @@ class LakeFSLoader:
             logger.info(f"Data uploaded successfully to {lakefs_s3_path} with {len(new_cleaned_df)} records.")
         else:
             logger.info("No new records found.")
+        return new_cleaned_df
+
+    @staticmethod
+    def anti_join(data: pd.DataFrame, existing: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+        # rows of data whose keys are not in existing; only the key columns take part in the merge
+        merged = data.merge(existing[keys].drop_duplicates(), on=keys, how="left", indicator=True)
+        return merged[merged["_merge"] == "left_only"].drop(columns=["_merge"])
+
+    def read_columns(self, lakefs_endpoint: str, lakefs_s3_path: str, columns: list[str], partitions: Optional[list[str]] = None) -> pd.DataFrame:
+        # files written before a column existed lack it; unify the file schemas so those rows read
+        # as null, and leave out requested columns that no file has. partitions ("year=/month=/day="
+        # keys) limits the listing and the read to those directories; one that does not exist yet
+        # reads as empty.
+        storage_options = {
+            "key": os.getenv("ACCESS_KEY"),
+            "secret": os.getenv("SECRET_KEY"),
+            "client_kwargs": {
+                "endpoint_url": lakefs_endpoint
+            }
+        }
+        fs = fsspec.filesystem("s3", **storage_options)
+        path = lakefs_s3_path.removeprefix("s3://")
+        if partitions is None:
+            files = ds.dataset(path, filesystem=fs, format="parquet", partitioning="hive").files
+        else:
+            files = [
+                file
+                for key in partitions
+                for file in fs.find(f"{path}/{key}")
+                if not os.path.basename(file).startswith(("_", "."))
+            ]
+        if not files:
+            return pd.DataFrame()
+        dataset = ds.dataset(files, filesystem=fs, format="parquet")
+        schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.get_fragments()], promote_options="permissive")
+        dataset = ds.dataset(files, schema=schema, filesystem=fs, format="parquet")
+        return dataset.to_table(columns=[column for column in columns if column in schema.names]).to_pandas()
+
+    def read_partitions(self, lakefs_endpoint: str, lakefs_s3_path: str, columns: list[str], partitions: list[str]) -> pd.DataFrame:
+        # read_columns of each partition, with the year/month/day of its directory put back
+        frames = []
+        for key in partitions:
+            frame = self.read_columns(lakefs_endpoint, lakefs_s3_path, columns, partitions=[key])
+            if frame.empty:
+                continue
+            values = dict(part.split("=") for part in key.split("/"))
+            frames.append(frame.assign(**{name: int(value) for name, value in values.items()}))
+        if not frames:
+            return pd.DataFrame(columns=columns + ['year', 'month', 'day'])
+        return pd.concat(frames, ignore_index=True)
+
+    def read(self, lakefs_endpoint: str, lakefs_s3_path: str, columns: list[str] = None) -> pd.DataFrame:
+        storage_options = {
+            "key": os.getenv("ACCESS_KEY"),
+            "secret": os.getenv("SECRET_KEY"),
+            "client_kwargs": {
+                "endpoint_url": lakefs_endpoint
+            }
+        }
+        return pd.read_parquet(
+            lakefs_s3_path,
+            columns=columns,
+            storage_options=storage_options,
+            engine='pyarrow',
+        )
+
+    def exists(self, lakefs_endpoint: str, lakefs_s3_path: str) -> bool:
+        storage_options = {
+            "key": os.getenv("ACCESS_KEY"),
+            "secret": os.getenv("SECRET_KEY"),
+            "client_kwargs": {
+                "endpoint_url": lakefs_endpoint
+            }
+        }
+        fs = fsspec.filesystem("s3", **storage_options)
+        return fs.exists(lakefs_s3_path)
+
+    def load_counts(self, counts: pd.DataFrame, lakefs_endpoint: str, lakefs_s3_path: str = lakefs_s3_path_ml_counts, overwrite: bool = False, partitions: Optional[list[str]] = None) -> None:
+        # overwrite is for rebuilding the table from the full dataset it counts; partitions
+        # ("year=/month=/day=" keys) replaces just those days with counts rebuilt from them
+        storage_options = {
+            "key": os.getenv("ACCESS_KEY"),
+            "secret": os.getenv("SECRET_KEY"),
+            "client_kwargs": {
+                "endpoint_url": lakefs_endpoint
+            }
+        }
+        fs = fsspec.filesystem("s3", **storage_options)
+        if overwrite and fs.exists(lakefs_s3_path):
+            fs.rm(lakefs_s3_path, recursive=True)
+            logger.info(f"Removed existing counts at {lakefs_s3_path}")
+        for key in partitions or []:
+            if fs.exists(f"{lakefs_s3_path}/{key}"):
+                fs.rm(f"{lakefs_s3_path}/{key}", recursive=True)
+        if counts.empty:
+            logger.info(f"No counts to upload to {lakefs_s3_path}.")
+            return
+        counts.to_parquet(
+            lakefs_s3_path,
+            storage_options=storage_options,
+            partition_cols=['year', 'month', 'day'],
+            engine='pyarrow',
+        )
+        logger.info(f"Counts uploaded successfully to {lakefs_s3_path} with {len(counts)} rows.")
+
+    @staticmethod
+    def read_catalog(lakefs_endpoint: str, lakefs_s3_path: str = lakefs_s3_path_catalog) -> Optional[dict]:
+        # static so planners can read the manifest without restarting the lakeFS container
+        storage_options = {
+            "key": os.getenv("ACCESS_KEY"),
+            "secret": os.getenv("SECRET_KEY"),
+            "client_kwargs": {
+                "endpoint_url": lakefs_endpoint
+            }
+        }
+        fs = fsspec.filesystem("s3", **storage_options)
+        if not fs.exists(lakefs_s3_path):
+            return None
+        with fs.open(lakefs_s3_path, "r") as f:
+            return json.load(f)
+
+    def load_catalog(self, catalog: dict, lakefs_endpoint: str, lakefs_s3_path: str = lakefs_s3_path_catalog) -> None:
+        storage_options = {
+            "key": os.getenv("ACCESS_KEY"),
+            "secret": os.getenv("SECRET_KEY"),
+            "client_kwargs": {
+                "endpoint_url": lakefs_endpoint
+            }
+        }
+        fs = fsspec.filesystem("s3", **storage_options)
+        with fs.open(lakefs_s3_path, "w") as f:
+            json.dump(catalog, f, ensure_ascii=False, indent=2)
+        logger.info(f"Catalog uploaded to {lakefs_s3_path}: {catalog['rows']} rows in {len(catalog['partitions'])} partitions.")
 
 if __name__ == "__main__":
     loader = LakeFSLoader(host="http://lakefs_db:8000")
@@ -0,0 +1,20 @@
+import pandas as pd
+
+# Finest grain of the rollup; every grouping the dashboard offers is a whole number of these
+TAG_COUNTS_BUCKET = "15min"
+
+TAG_COUNT_KEYS = ["tag", "bucket"]
+TAG_COUNT_COLUMNS = TAG_COUNT_KEYS + ["count", "year", "month", "day"]
+
+
+def tag_counts(data: pd.DataFrame, freq: str = TAG_COUNTS_BUCKET) -> pd.DataFrame:
+    # tag x time bucket -> number of tweets. Counts are additive, so coarser intervals are sums
+    # of these buckets; an incremental load replaces the days it touched with their recount.
+    if data is None or data.empty:
+        return pd.DataFrame(columns=TAG_COUNT_COLUMNS)
+    buckets = pd.to_datetime(data["postTimeRaw"]).dt.floor(freq)
+    counts = data.assign(bucket=buckets).groupby(TAG_COUNT_KEYS).size().reset_index(name="count")
+    counts["year"] = counts["bucket"].dt.year
+    counts["month"] = counts["bucket"].dt.month
+    counts["day"] = counts["bucket"].dt.day
+    return counts[TAG_COUNT_COLUMNS]
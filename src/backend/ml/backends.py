@@ -0,0 +1,246 @@
+import asyncio
+import math
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+
+# Import ML configuration
+from src.backend.ml.config_ml import (
+    instruction,
+    prompt_template,
+    MODEL_NAME,
+    MAX_OUTPUT_TOKENS,
+    CLASSIFIER_BACKEND,
+    MOCK_SERVER_URL,
+    FAST_TIER_THRESHOLD,
+    FAST_TIER_MAX_EXAMPLES,
+)
+# Import adaptive batching
+from src.backend.ml.batching import TruncatedResponseError
+# Import response parsing
+from src.backend.ml.response_parser import ClassificationResponse, PartialResponseError, parse_response
+# Import async classification engine
+from src.backend.ml.classifier_engine import run_sync
+# Import classification cache
+from src.backend.ml.classification_cache import ClassificationCache
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+load_dotenv()
+
+
+class ClassifierBackend(ABC):
+    # A backend takes a batch of {"index", "tweetText"} rows plus the current topic lists and
+    # answers in the model's JSON shape: {"faq": [{"index", "text", "topic", "subtopic"}], "issue": [...]}
+    name = "base"
+    rate_limited = False
+
+    @abstractmethod
+    async def classify(self, rows: list[dict], topics: dict) -> dict:
+        ...
+
+    def classify_sync(self, rows: list[dict], topics: dict) -> dict:
+        return run_sync(self.classify(rows, topics))
+
+
+class GeminiBackend(ClassifierBackend):
+    name = "gemini"
+    rate_limited = True
+
+    def __init__(self, model: str = MODEL_NAME):
+        self.model = model
+        self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        self._aio_client = None
+        self._aio_loop = None
+
+    def aio(self):
+        # the async client's connections belong to the loop that opened them, and run_sync starts
+        # a new loop per call: a backend that outlives one loop opens a client for the next
+        loop = asyncio.get_running_loop()
+        if self._aio_loop is not loop:
+            self._aio_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY")).aio
+            self._aio_loop = loop
+        return self._aio_client
+
+    @staticmethod
+    def build_prompt(rows: list[dict], faq_topic, faq_subtopic, issue_topic, issue_subtopic) -> str:
+        return prompt_template.format(
+            faq_topic = faq_topic,
+            faq_subtopic = faq_subtopic,
+            issue_topic = issue_topic,
+            issue_subtopic = issue_subtopic,
+            messages="\n".join([f"{row['index']}: {row['tweetText']}" for row in rows]),
+        )
+
+    @staticmethod
+    def generation_config() -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            system_instruction=instruction,
+            temperature=0.2, # low temperature for more deterministic output kub
+            max_output_tokens=MAX_OUTPUT_TOKENS,
+            response_mime_type="application/json",
+            response_schema=ClassificationResponse,
+        )
+
+    @staticmethod
+    def parse(response) -> dict:
+        # an answer that parses completely is kept even if it stopped right at the token limit;
+        # a partial one keeps whatever complete rows made it before the cut
+        try:
+            return parse_response(response.text)
+        except PartialResponseError:
+            raise
+        except ValueError:
+            if response.candidates and response.candidates[0].finish_reason == types.FinishReason.MAX_TOKENS:
+                raise TruncatedResponseError("Response hit the output token limit")
+            raise
+
+    async def classify(self, rows: list[dict], topics: dict) -> dict:
+        response = await self.aio().models.generate_content(
+            model=self.model,
+            contents=self.build_prompt(rows, **topics),
+            config=self.generation_config(),
+        )
+        return self.parse(response)
+
+    def classify_sync(self, rows: list[dict], topics: dict) -> dict:
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=self.build_prompt(rows, **topics),
+            config=self.generation_config(),
+        )
+        return self.parse(response)
+
+
+class MockBackend(ClassifierBackend):
+    # Talks to src/backend/ml/mock_server.py, which answers deterministically from the tweet text
+    name = "mock"
+
+    def __init__(self, url: str = MOCK_SERVER_URL, timeout: float = 30.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    @staticmethod
+    def payload(rows: list[dict], topics: dict) -> dict:
+        return {
+            "rows": [{"index": row["index"], "tweetText": str(row["tweetText"])} for row in rows],
+            "topics": {key: sorted(values) for key, values in topics.items()},
+        }
+
+    async def classify(self, rows: list[dict], topics: dict) -> dict:
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            response = await client.post(f"{self.url}/classify", json=self.payload(rows, topics))
+            response.raise_for_status()
+            return response.json()
+
+    def classify_sync(self, rows: list[dict], topics: dict) -> dict:
+        response = httpx.post(f"{self.url}/classify", json=self.payload(rows, topics), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class KeywordBackend(ClassifierBackend):
+    # CPU tier: TF-IDF over character trigrams (Thai has no spaces to split words on) of tweets
+    # the model already labelled. A new tweet inherits the labels of its nearest labelled tweet
+    # when the cosine similarity clears the threshold; anything below it is ambiguous.
+    name = "keyword"
+    _shared: Optional["KeywordBackend"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, examples: list[tuple[str, dict]] = (), threshold: float = FAST_TIER_THRESHOLD, ngram: int = 3):
+        self.threshold = threshold
+        self.ngram = ngram
+        self.fit(examples)
+
+    @classmethod
+    def from_cache(cls, cache: ClassificationCache, limit: int = FAST_TIER_MAX_EXAMPLES, **kwargs) -> "KeywordBackend":
+        return cls(cache.labelled_examples(limit), **kwargs)
+
+    @classmethod
+    def shared(cls, cache: ClassificationCache) -> "KeywordBackend":
+        # fitting walks the whole classification cache, so a process fits once and reuses it
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls.from_cache(cache)
+            return cls._shared
+
+    def grams(self, text: str) -> Counter:
+        text = re.sub(r"\s+", " ", str(text).lower()).strip()
+        if len(text) < self.ngram:
+            return Counter([text]) if text else Counter()
+        return Counter(text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1))
+
+    def vectorize(self, grams: Counter) -> dict[str, float]:
+        vector = {gram: (1 + math.log(count)) * self.idf.get(gram, self.default_idf) for gram, count in grams.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {gram: weight / norm for gram, weight in vector.items()}
+
+    def fit(self, examples: list[tuple[str, dict]]) -> None:
+        examples = list(examples)
+        grams = [self.grams(text) for text, _ in examples]
+        doc_freq = Counter(gram for doc in grams for gram in doc)
+        n_docs = len(examples)
+        self.idf = {gram: math.log((1 + n_docs) / (1 + freq)) + 1 for gram, freq in doc_freq.items()}
+        self.default_idf = math.log(1 + n_docs) + 1
+        self.results = [result for _, result in examples]
+        self.postings: dict[str, list[tuple[int, float]]] = defaultdict(list)
+        for doc_id, doc in enumerate(grams):
+            for gram, weight in self.vectorize(doc).items():
+                self.postings[gram].append((doc_id, weight))
+        logger.info(f"Fast tier fitted on {n_docs} labelled tweets ({len(self.idf)} n-grams)")
+
+    def nearest(self, text: str) -> tuple[float, Optional[dict]]:
+        scores: dict[int, float] = defaultdict(float)
+        for gram, weight in self.vectorize(self.grams(text)).items():
+            for doc_id, doc_weight in self.postings.get(gram, ()):
+                scores[doc_id] += weight * doc_weight
+        if not scores:
+            return 0.0, None
+        doc_id = max(scores, key=scores.get)
+        return scores[doc_id], self.results[doc_id]
+
+    def predict(self, text: str) -> Optional[dict]:
+        score, result = self.nearest(text)
+        if result is None or score < self.threshold:
+            return None
+        return {"faq": result.get("faq"), "issue": result.get("issue")}
+
+    def settle(self, rows: list[dict]) -> tuple[dict[int, dict], list[dict]]:
+        settled, ambiguous = {}, []
+        for row in rows:
+            result = self.predict(row["tweetText"])
+            if result is None:
+                ambiguous.append(row)
+            else:
+                settled[row["index"]] = result
+        return settled, ambiguous
+
+    async def classify(self, rows: list[dict], topics: dict) -> dict:
+        response = {"faq": [], "issue": []}
+        settled, _ = self.settle(rows)
+        text_by_index = {row["index"]: row["tweetText"] for row in rows}
+        for index, result in settled.items():
+            for kind in ("faq", "issue"):
+                if result[kind]:
+                    response[kind].append({"index": index, "text": text_by_index[index], **result[kind]})
+        return response
+
+
+def get_backend(name: str = CLASSIFIER_BACKEND, cache: Optional[ClassificationCache] = None) -> ClassifierBackend:
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "mock":
+        return MockBackend()
+    if name == "keyword":
+        return KeywordBackend.shared(cache or ClassificationCache())
+    raise ValueError(f"Unknown classifier backend: {name}")
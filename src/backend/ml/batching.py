@@ -0,0 +1,78 @@
+from collections import deque
+
+# Import ML configuration
+from src.backend.ml.config_ml import BATCH_TARGET_TOKENS, BATCH_MIN_TOKENS, BATCH_MAX_TOKENS, BATCH_MAX_ROWS
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+# JSON keys, index and labels the model writes around each echoed tweet
+ROW_OVERHEAD_TOKENS = 40
+
+
+def estimate_tokens(text: str) -> int:
+    # Thai has no word boundaries and Gemini splits it at roughly 2-3 chars per token,
+    # so count generously to stay under the token quotas
+    return max(1, len(text) // 2)
+
+
+class TruncatedResponseError(ValueError):
+    pass
+
+
+class AdaptiveBatcher:
+    # Packs tweets into prompts up to a token budget instead of a fixed row count.
+    # The budget follows AIMD: it halves when a response is truncated or cannot be parsed
+    # and grows a little after every clean response, so it settles just under the point
+    # where the model starts cutting its answer short.
+    def __init__(
+        self,
+        target_tokens: int = BATCH_TARGET_TOKENS,
+        min_tokens: int = BATCH_MIN_TOKENS,
+        max_tokens: int = BATCH_MAX_TOKENS,
+        max_rows: int = BATCH_MAX_ROWS,
+        growth: float = 1.15,
+        shrink: float = 0.5,
+    ):
+        self.budget = float(target_tokens)
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.max_rows = max_rows
+        self.growth = growth
+        self.shrink = shrink
+
+    @staticmethod
+    def row_tokens(row: dict) -> int:
+        return estimate_tokens(f"{row['index']}: {row['tweetText']}") + ROW_OVERHEAD_TOKENS
+
+    def take(self, pending: deque) -> list[dict]:
+        # always hand out at least one row so an oversized tweet still gets its own prompt
+        batch = [pending.popleft()]
+        used = self.row_tokens(batch[0])
+        while pending and len(batch) < self.max_rows:
+            cost = self.row_tokens(pending[0])
+            if used + cost > self.budget:
+                break
+            batch.append(pending.popleft())
+            used += cost
+        return batch
+
+    def pack(self, rows: list[dict]) -> list[list[dict]]:
+        pending = deque(rows)
+        batches = []
+        while pending:
+            batches.append(self.take(pending))
+        return batches
+
+    def record_success(self) -> None:
+        self.budget = min(self.max_tokens, self.budget * self.growth)
+
+    def batch_tokens(self, batch: list[dict]) -> int:
+        return sum(self.row_tokens(row) for row in batch)
+
+    def record_failure(self, batch: list[dict]) -> None:
+        # shrink relative to the failed batch, so several in-flight batches cut with the
+        # same budget failing together only halve it once
+        self.budget = max(self.min_tokens, min(self.budget, self.batch_tokens(batch) * self.shrink))
+        logger.info(f"Shrinking classification batch budget to {self.budget:.0f} tokens")
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+# Import path configuration
+from config.path_config import CLASSIFICATION_CACHE
+# Import ML configuration
+from src.backend.ml.config_ml import CACHE_MAX_ENTRIES
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+
+class ClassificationCache:
+    # Persistent tweetText -> {"faq": {...} | None, "issue": {...} | None} store.
+    # Tweets the model left out are cached as None on both sides so they are not re-sent either.
+    def __init__(self, path: str | Path = CLASSIFICATION_CACHE, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        os.makedirs(self.path.parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS classification ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON classification(last_access)")
+        # text and source were added for the fast tier; older cache files are migrated in place
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(classification)")}
+        if "text" not in columns:
+            self._conn.execute("ALTER TABLE classification ADD COLUMN text TEXT")
+        if "source" not in columns:
+            self._conn.execute("ALTER TABLE classification ADD COLUMN source TEXT NOT NULL DEFAULT 'model'")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize("NFC", str(text))
+        return re.sub(r"\s+", " ", text).strip()
+
+    @classmethod
+    def key(cls, text: str) -> str:
+        return hashlib.sha256(cls.normalize(text).encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, dict]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # sqlite caps bound parameters per statement, so look up in chunks
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, result FROM classification WHERE key IN ({placeholders})", chunk  # nosec B608
+                ).fetchall()
+                found.update({key: json.loads(result) for key, result in rows})
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE classification SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, results: dict[str, dict], texts: dict[str, str] | None = None, source: str = "model") -> None:
+        if not results:
+            return
+        texts = texts or {}
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO classification (key, result, created, last_access, text, source) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (key, json.dumps(result, ensure_ascii=False), now, now, texts.get(key), source)
+                    for key, result in results.items()
+                ],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # least recently used entries go first once the table outgrows max_entries
+        size = self._conn.execute("SELECT COUNT(*) FROM classification").fetchone()[0]
+        overflow = size - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM classification WHERE key IN "
+                "(SELECT key FROM classification ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+            logger.info(f"Evicted {overflow} entries from classification cache")
+
+    def labelled_examples(self, limit: int, exclude_source: str = "keyword") -> list[tuple[str, dict]]:
+        # skips the fast tier's own answers so it never learns from its guesses
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT text, result FROM classification WHERE text IS NOT NULL AND source != ? "
+                "ORDER BY last_access DESC LIMIT ?",
+                (exclude_source, limit),
+            ).fetchall()
+        return [(text, json.loads(result)) for text, result in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM classification").fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": len(self),
+            "max_entries": self.max_entries,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
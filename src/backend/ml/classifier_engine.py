@@ -0,0 +1,241 @@
+import asyncio
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+# Import ML configuration
+from src.backend.ml.config_ml import (
+    MAX_CONCURRENCY,
+    REQUESTS_PER_MINUTE,
+    TOKENS_PER_MINUTE,
+    MAX_RETRIES,
+    RETRY_BASE_DELAY,
+)
+# Import adaptive batching
+from src.backend.ml.batching import AdaptiveBatcher, TruncatedResponseError, estimate_tokens
+# Import response parsing
+from src.backend.ml.response_parser import PartialResponseError
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+TOPIC_KEYS = ("faq_topic", "faq_subtopic", "issue_topic", "issue_subtopic")
+
+
+def run_sync(coro):
+    # Prefect may call sync tasks from inside a running loop (the flows are async),
+    # in which case the coroutine gets its own loop on a helper thread
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: int = REQUESTS_PER_MINUTE, tokens_per_minute: int = TOKENS_PER_MINUTE, window: float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events: deque[tuple[float, int]] = deque()
+        self._tokens_in_window = 0
+        self._lock = asyncio.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self._events and now - self._events[0][0] >= self.window:
+            _, tokens = self._events.popleft()
+            self._tokens_in_window -= tokens
+
+    async def acquire(self, tokens: int) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                under_rpm = len(self._events) < self.requests_per_minute
+                # A single request larger than the whole TPM budget is let through on an empty window
+                under_tpm = self._tokens_in_window + tokens <= self.tokens_per_minute or not self._events
+                if under_rpm and under_tpm:
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+                wait = self.window - (now - self._events[0][0])
+                logger.debug(f"Rate limit reached, waiting {wait:.1f}s")
+                await asyncio.sleep(max(wait, 0.05))
+
+
+class IncompleteClassificationError(RuntimeError):
+    # raised once the run is over, with the batches that did get classified: callers decide
+    # whether a partial result is any use, but it is never mistaken for a complete one
+    def __init__(self, completed: list[tuple[list[dict], dict]], failed: list[dict], total: int):
+        super().__init__(f"Classification failed for {len(failed)} of {total} tweets")
+        self.completed = completed
+        self.failed = failed
+
+
+class TopicState:
+    # Batches in flight each format their prompt from a snapshot taken right before the call,
+    # and fold their labels back in when they finish. Merging is a set union, so the order
+    # in which concurrent batches complete does not change the final topic sets.
+    def __init__(self):
+        self.topics: dict[str, set[str]] = {key: set() for key in TOPIC_KEYS}
+        self.version = 0
+
+    def snapshot(self, rows: Optional[list[dict]] = None) -> dict[str, list[str]]:
+        return {key: sorted(values) for key, values in self.topics.items()}
+
+    def merge(self, response: dict) -> None:
+        for kind in ("faq", "issue"):
+            for row in response.get(kind, []):
+                self.topics[f"{kind}_topic"].update(row.get("topic", []))
+                self.topics[f"{kind}_subtopic"].update(row.get("subtopic", []))
+        self.version += 1
+
+
+class AsyncClassificationEngine:
+    def __init__(
+        self,
+        request_fn: Callable[[list[dict], dict], Awaitable[dict]],
+        token_fn: Optional[Callable[[list[dict], dict], int]] = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_retries: int = MAX_RETRIES,
+        retry_base_delay: float = RETRY_BASE_DELAY,
+    ):
+        self.request_fn = request_fn
+        self.token_fn = token_fn or self.default_token_fn
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+    @staticmethod
+    def default_token_fn(rows: list[dict], topics: dict) -> int:
+        text = "\n".join(str(row["tweetText"]) for row in rows)
+        # prompt + roughly the same amount again for the JSON echo of the messages
+        return estimate_tokens(text) * 2
+
+    def backoff(self, attempt: int) -> float:
+        # exponential backoff with full jitter so retries from parallel batches do not line up
+        return random.uniform(0, self.retry_base_delay * (2 ** attempt))
+
+    async def classify_batch(self, batch_no: int, rows: list[dict], topics: TopicState) -> dict:
+        for attempt in range(self.max_retries + 1):
+            snapshot = topics.snapshot(rows)
+            await self.rate_limiter.acquire(self.token_fn(rows, snapshot))
+            try:
+                start = time.perf_counter()
+                response = await self.request_fn(rows, snapshot)
+                topics.merge(response)
+                logger.info(f"Batch {batch_no} ({len(rows)} rows) classified in {time.perf_counter() - start:.1f}s")
+                return response
+            except PartialResponseError as e:
+                # the recovered rows are still good labels, fold them in before the caller re-queues the rest
+                topics.merge(e.response)
+                raise
+            except TruncatedResponseError:
+                # the answer did not fit, the caller re-packs the batch smaller
+                raise
+            except Exception as e:
+                # transport errors and answers with nothing usable in them (an empty, blocked
+                # reply) are retried as they are, a bounded number of times
+                if attempt == self.max_retries:
+                    logger.error(f"Batch {batch_no} failed after {attempt + 1} attempts: {e}")
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(f"Batch {batch_no} attempt {attempt + 1} failed: {e}. Retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def answered(batch: list[dict], response: dict) -> tuple[list[dict], list[dict]]:
+        indexes = set()
+        for kind in ("faq", "issue"):
+            for row in response.get(kind, []):
+                try:
+                    indexes.add(int(row["index"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        answered = [row for row in batch if row["index"] in indexes]
+        return answered, [row for row in batch if row["index"] not in indexes]
+
+    async def run(
+        self,
+        rows: list[dict],
+        topics: Optional[TopicState] = None,
+        batcher: Optional[AdaptiveBatcher] = None,
+        on_batch_done: Optional[Callable[[list[dict], dict], None]] = None,
+    ) -> list[tuple[list[dict], dict]]:
+        # on_batch_done is called as soon as a batch (or the recovered part of one) is classified,
+        # so callers can checkpoint it; a failure later in the run then only costs the failed rows
+        topics = topics if topics is not None else TopicState()
+        batcher = batcher or AdaptiveBatcher()
+        pending = deque(rows)
+        completed = []
+        # rows that must go out alone: their batch kept failing at the smallest budget
+        singles: deque = deque()
+        failed: list[dict] = []
+        attempts: dict[int, int] = {}
+        in_flight = 0
+        batch_count = 0
+
+        def done(batch: list[dict], response: dict) -> None:
+            completed.append((batch, response))
+            if on_batch_done is not None:
+                on_batch_done(batch, response)
+
+        async def worker():
+            nonlocal in_flight, batch_count
+            # batches are cut when a worker frees up, so they always use the latest budget
+            while pending or singles or in_flight:
+                if not pending and not singles:
+                    await asyncio.sleep(0.1)
+                    continue
+                batch = [singles.popleft()] if singles else batcher.take(pending)
+                batch_count += 1
+                batch_no = batch_count
+                in_flight += 1
+                try:
+                    response = await self.classify_batch(batch_no, batch, topics)
+                    batcher.record_success()
+                    done(batch, response)
+                except (TruncatedResponseError, PartialResponseError) as e:
+                    retry = batch
+                    if isinstance(e, PartialResponseError):
+                        answered, retry = self.answered(batch, e.response)
+                        if answered:
+                            done(answered, e.response)
+                    if not retry:
+                        continue
+                    at_minimum = batcher.budget <= batcher.min_tokens
+                    batcher.record_failure(batch)
+                    # every row counts its attempts, whatever the size of the batch it was in
+                    for row in retry:
+                        attempts[row['index']] = attempts.get(row['index'], 0) + 1
+                    given_up = [row for row in retry if attempts[row['index']] > self.max_retries]
+                    if given_up:
+                        logger.error(f"Giving up on {len(given_up)} tweets after {self.max_retries + 1} unusable responses: {e}")
+                        failed.extend(given_up)
+                    retry = [row for row in retry if attempts[row['index']] <= self.max_retries]
+                    if not retry:
+                        continue
+                    logger.warning(f"Batch {batch_no} ({len(batch)} rows) returned an unusable response: {e}. Re-queueing {len(retry)} rows")
+                    if at_minimum or len(batch) == 1:
+                        # the budget cannot shrink any further, so the rows are tried one at a time
+                        singles.extend(retry)
+                    else:
+                        pending.extendleft(reversed(retry))
+                except Exception:
+                    # out of retries on a transport error; only this batch is lost
+                    failed.extend(batch)
+                finally:
+                    in_flight -= 1
+
+        logger.info(f"Classifying {len(rows)} tweets with concurrency {self.max_concurrency}")
+        await asyncio.gather(*[worker() for _ in range(self.max_concurrency)])
+        logger.info(f"Classified {len(rows)} tweets in {batch_count} calls ({len(completed)} succeeded, {len(failed)} tweets failed)")
+        if failed:
+            raise IncompleteClassificationError(completed, failed, len(rows))
+        return completed
@@ -1,3 +1,54 @@
+import hashlib
+import json
+import os
+
+# Classification engine settings
+MODEL_NAME = "gemini-2.0-flash"
+MAX_CONCURRENCY = int(os.getenv("CLASSIFY_MAX_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = int(os.getenv("CLASSIFY_REQUESTS_PER_MINUTE", "15"))
+TOKENS_PER_MINUTE = int(os.getenv("CLASSIFY_TOKENS_PER_MINUTE", "1000000"))
+MAX_RETRIES = int(os.getenv("CLASSIFY_MAX_RETRIES", "4"))
+RETRY_BASE_DELAY = float(os.getenv("CLASSIFY_RETRY_BASE_DELAY", "2.0"))
+CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFY_CACHE_MAX_ENTRIES", "200000"))
+
+# Classifier backend: "gemini", "mock" (local mock server) or "keyword" (offline CPU tier only)
+CLASSIFIER_BACKEND = os.getenv("CLASSIFIER_BACKEND", "gemini")
+MOCK_SERVER_URL = os.getenv("MOCK_SERVER_URL", "http://localhost:8010")
+# The CPU fast tier settles tweets that are this close to an earlier model-labelled tweet.
+# Opt-in: the tweets it settles never reach the model, which changes the stored labels
+FAST_TIER_ENABLED = os.getenv("FAST_TIER_ENABLED", "false").lower() == "true"
+FAST_TIER_THRESHOLD = float(os.getenv("FAST_TIER_THRESHOLD", "0.8"))
+FAST_TIER_MAX_EXAMPLES = 50000
+
+# Near-duplicate collapsing: tweets above this estimated Jaccard similarity share one prompt slot
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "true").lower() == "true"
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+NEAR_DUP_NUM_PERM = 64
+NEAR_DUP_BANDS = 8
+
+# Topic taxonomy: each prompt lists at most TAXONOMY_TOP_K labels per topic/subtopic list
+TAXONOMY_TOP_K = int(os.getenv("TAXONOMY_TOP_K", "30"))
+TAXONOMY_MAX_LABELS = 500
+TAXONOMY_MERGE_RATIO = 0.9
+# Label counts halve for every this many days a label goes unused, so old topics give way to new ones
+TAXONOMY_HALF_LIFE_DAYS = float(os.getenv("TAXONOMY_HALF_LIFE_DAYS", "14"))
+
+# Adaptive batching: budgets are estimated tweet tokens per prompt. The model echoes every
+# tweet back in its JSON answer, so the budget has to leave room under MAX_OUTPUT_TOKENS.
+MAX_OUTPUT_TOKENS = 8192
+BATCH_TARGET_TOKENS = int(os.getenv("CLASSIFY_BATCH_TARGET_TOKENS", "2000"))
+BATCH_MIN_TOKENS = 200
+BATCH_MAX_TOKENS = 5000
+BATCH_MAX_ROWS = 80
+
+# Classification API jobs (wordcloud_api.py)
+JOB_WORKERS = int(os.getenv("CLASSIFY_JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("CLASSIFY_JOB_QUEUE_SIZE", "32"))
+JOB_RESULT_CACHE_SIZE = int(os.getenv("CLASSIFY_JOB_RESULT_CACHE_SIZE", "128"))
+
+# Label count table: finest time bucket the dashboard can group by
+COUNTS_BUCKET = "15min"
+
 instruction = """
 คุณทำหน้าที่ในฝ่ายประชาสัมพันธ์ของมหาวิทยาลัย เป้าหมายของคุณคือการรวบรวมและจัดกลุ่ม 
 "คำถามที่พบบ่อย" (FAQ) หรือ "ปัญหาที่พบบ่อย" (Issue) จากโซเชียลมีเดีย 
@@ -75,4 +126,18 @@ subtopic: ['ระบบล่ม', 'ความเสถียรของร
 {messages}
 
 โปรดวิเคราะห์และจัดกลุ่มข้อความตามคำแนะนำที่ให้ไว้ และส่งคืนเป็น JSON ตามรูปแบบที่กำหนด
-"""
\ No newline at end of file
+"""
+
+# Everything that decides the labels a tweet gets. Cached word-cloud task results are keyed on it,
+# so a new prompt, model or tier setting classifies again instead of reusing old results
+CLASSIFIER_VERSION = hashlib.md5(json.dumps([
+    MODEL_NAME,
+    CLASSIFIER_BACKEND,
+    FAST_TIER_ENABLED,
+    FAST_TIER_THRESHOLD,
+    NEAR_DUP_ENABLED,
+    NEAR_DUP_THRESHOLD,
+    TAXONOMY_TOP_K,
+    instruction,
+    prompt_template,
+], ensure_ascii=False).encode("utf-8")).hexdigest()
@@ -0,0 +1,38 @@
+import pandas as pd
+
+# Import ML configuration
+from src.backend.ml.config_ml import COUNTS_BUCKET
+
+COUNT_KEYS = ["tag", "bucket", "level", "label"]
+COUNT_COLUMNS = COUNT_KEYS + ["count", "year", "month", "day"]
+
+
+def tag_stop_words(tags: pd.Series) -> set[str]:
+    # the hashtag words themselves show up as labels and say nothing about the tweet
+    return set(
+        word
+        for tag in tags.dropna()
+        for word in tag.split("#")
+        if word.strip()
+    )
+
+
+def label_counts(faqs_df: pd.DataFrame, freq: str = COUNTS_BUCKET) -> pd.DataFrame:
+    # tag x time bucket x topic/subtopic label -> number of tweets. Counts are additive and
+    # summed on read; an incremental load replaces the days it touched with their recount.
+    if faqs_df is None or faqs_df.empty:
+        return pd.DataFrame(columns=COUNT_COLUMNS)
+    stop_words = tag_stop_words(faqs_df["tag"])
+    frames = []
+    for level in ("topic", "subtopic"):
+        exploded = faqs_df[["tag", "postTimeRaw", level]].explode(level).dropna(subset=[level])
+        exploded = exploded.rename(columns={level: "label"})
+        exploded = exploded[~exploded["label"].isin(stop_words) & (exploded["label"].astype(str).str.strip() != "")]
+        exploded["bucket"] = pd.to_datetime(exploded["postTimeRaw"]).dt.floor(freq)
+        exploded["level"] = level
+        frames.append(exploded[COUNT_KEYS])
+    counts = pd.concat(frames).groupby(COUNT_KEYS).size().reset_index(name="count")
+    counts["year"] = counts["bucket"].dt.year
+    counts["month"] = counts["bucket"].dt.month
+    counts["day"] = counts["bucket"].dt.day
+    return counts[COUNT_COLUMNS]
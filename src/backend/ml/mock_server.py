@@ -0,0 +1,61 @@
+import asyncio
+import hashlib
+import os
+
+from fastapi import FastAPI
+import uvicorn
+
+# Stand-in for Gemini when benchmarking or developing offline:
+#   uvicorn src.backend.ml.mock_server:app --port 8010
+# and run the flows with CLASSIFIER_BACKEND=mock. Answers depend only on the tweet text,
+# so repeated runs over the same data produce identical labels.
+
+app = FastAPI()
+
+MOCK_LATENCY_MS = int(os.getenv("MOCK_LATENCY_MS", "0"))
+
+QUESTION_MARKERS = ("?", "ไหม", "มั้ย", "อะไร", "ยังไง", "อย่างไร", "เมื่อไหร่", "ที่ไหน", "เหรอ", "หรอ", "กี่")
+ISSUE_MARKERS = ("ล่ม", "ปัญหา", "แย่", "ช้า", "เสีย", "ไม่ได้", "ร้องเรียน", "พัง")
+
+TOPICS = {
+    "สอบถามเอกสาร": ["เอกสารการสมัคร", "การเข้าถึงข้อมูล"],
+    "หอพัก": ["กฎระเบียบหอพัก", "เวลาเปิด-ปิด"],
+    "ระบบลงทะเบียน": ["ระบบล่ม", "ความเสถียรของระบบ"],
+    "การรับสมัคร": ["เกณฑ์การรับสมัคร", "กำหนดการรับสมัคร"],
+    "ค่าเล่าเรียน": ["ค่าธรรมเนียม", "ทุนการศึกษา"],
+    "การเดินทาง": ["รถรับส่ง", "ที่จอดรถ"],
+}
+
+
+def digest(text: str) -> int:
+    return int(hashlib.md5(text.encode("utf-8"), usedforsecurity=False).hexdigest(), 16)
+
+
+def label(text: str) -> tuple[str, dict] | None:
+    if any(marker in text for marker in ISSUE_MARKERS):
+        kind = "issue"
+    elif any(marker in text for marker in QUESTION_MARKERS):
+        kind = "faq"
+    else:
+        return None
+    names = sorted(TOPICS)
+    topic = names[digest(text) % len(names)]
+    subtopics = TOPICS[topic]
+    return kind, {"topic": [topic], "subtopic": [subtopics[digest(text[::-1]) % len(subtopics)]]}
+
+
+@app.post("/classify")
+async def classify(payload: dict):
+    if MOCK_LATENCY_MS:
+        await asyncio.sleep(MOCK_LATENCY_MS / 1000)
+    response = {"faq": [], "issue": []}
+    for row in payload["rows"]:
+        labelled = label(row["tweetText"])
+        if labelled:
+            kind, labels = labelled
+            response[kind].append({"index": row["index"], "text": row["tweetText"], **labels})
+    return response
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8010)
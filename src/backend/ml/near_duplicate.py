@@ -0,0 +1,85 @@
+import re
+import zlib
+
+import numpy as np
+
+# Import ML configuration
+from src.backend.ml.config_ml import NEAR_DUP_THRESHOLD, NEAR_DUP_NUM_PERM, NEAR_DUP_BANDS
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+# smallest prime above 2**32, so (a * x + b) % PRIME stays inside uint64 for 32-bit a, b, x
+PRIME = np.uint64(4294967311)
+MAX_HASH = np.uint64(2**32 - 1)
+
+
+class NearDuplicateClusterer:
+    # MinHash over character shingles with LSH banding. Tweets whose signatures collide in any
+    # band are compared on estimated Jaccard similarity and merged with union-find; the earliest
+    # tweet of each cluster is its representative.
+    def __init__(
+        self,
+        threshold: float = NEAR_DUP_THRESHOLD,
+        num_perm: int = NEAR_DUP_NUM_PERM,
+        bands: int = NEAR_DUP_BANDS,
+        shingle_size: int = 4,
+        seed: int = 321,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2**32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 2**32, size=num_perm, dtype=np.uint64)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = str(text).lower()
+        text = re.sub(r"https?://\S+|@\w+", "", text)
+        # only whitespace and punctuation go; \W would also strip Thai vowel and tone marks
+        return re.sub(r"[\s.,!?\"'()\[\]{}:;…\-–—~*/|]+", "", text)
+
+    def shingles(self, text: str) -> np.ndarray:
+        text = self.normalize(text)
+        size = min(self.shingle_size, len(text)) or 1
+        grams = {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+        return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self.shingles(text)
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % PRIME
+        return np.minimum(permuted.min(axis=1), MAX_HASH)
+
+    def cluster(self, texts: list[str]) -> list[int]:
+        # returns, for every position, the position of its cluster representative
+        parent = list(range(len(texts)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        if not texts:
+            return parent
+        signatures = np.vstack([self.signature(text) for text in texts])
+        for band in range(self.bands):
+            columns = slice(band * self.rows_per_band, (band + 1) * self.rows_per_band)
+            buckets: dict[bytes, int] = {}
+            for position, band_signature in enumerate(signatures[:, columns]):
+                key = band_signature.tobytes()
+                first = buckets.setdefault(key, position)
+                if first == position:
+                    continue
+                similarity = np.mean(signatures[first] == signatures[position])
+                if similarity >= self.threshold:
+                    root_first, root_position = find(first), find(position)
+                    # keep the earliest position as root so it becomes the representative
+                    parent[max(root_first, root_position)] = min(root_first, root_position)
+        return [find(position) for position in range(len(texts))]
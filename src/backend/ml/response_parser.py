@@ -0,0 +1,109 @@
+import json
+import re
+
+from pydantic import BaseModel, ValidationError
+
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+KINDS = ("faq", "issue")
+
+
+class ClassifiedRow(BaseModel):
+    index: int
+    text: str = ""
+    topic: list[str]
+    subtopic: list[str]
+
+
+class ClassificationResponse(BaseModel):
+    # also sent to Gemini as response_schema so the model is constrained to this shape
+    issue: list[ClassifiedRow]
+    faq: list[ClassifiedRow]
+
+
+class PartialResponseError(ValueError):
+    # raised with whatever rows could be recovered from a truncated or malformed answer
+    def __init__(self, response: dict, message: str):
+        super().__init__(message)
+        self.response = response
+
+
+def strip_code_fence(text: str) -> str:
+    match = re.search(r"```(?:json)?\s*(.*?)(?:```|$)", text, re.DOTALL)
+    return match.group(1) if match else text
+
+
+def iter_objects(text: str, start: int):
+    # yields every complete top-level {...} inside the JSON array that opens at text[start]
+    depth, in_string, escaped, object_start = 0, False, False, None
+    for position in range(start, len(text)):
+        char = text[position]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char == "{":
+            if depth == 0:
+                object_start = position
+            depth += 1
+        elif char == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                yield text[object_start:position + 1]
+        elif char == "]" and depth == 0:
+            return
+
+
+def validate_rows(rows: list) -> tuple[list[dict], int]:
+    valid, dropped = [], 0
+    for row in rows:
+        try:
+            valid.append(ClassifiedRow.model_validate(row).model_dump())
+        except ValidationError:
+            dropped += 1
+    return valid, dropped
+
+
+def recover_rows(text: str, kind: str) -> list[dict]:
+    match = re.search(rf'"{kind}"\s*:\s*\[', text)
+    if not match:
+        return []
+    rows = []
+    for raw in iter_objects(text, match.end()):
+        try:
+            rows.append(json.loads(raw.replace("{{", "{").replace("}}", "}"), strict=False))
+        except ValueError:
+            continue
+    return validate_rows(rows)[0]
+
+
+def parse_response(response_text: str) -> dict:
+    text = strip_code_fence(response_text or "")
+    try:
+        data = json.loads(text[text.index("{"): text.rindex("}") + 1].replace("{{", "{").replace("}}", "}"), strict=False)
+        response, dropped = {}, 0
+        for kind in KINDS:
+            response[kind], dropped_rows = validate_rows(data.get(kind) or [])
+            dropped += dropped_rows
+        if not dropped:
+            return response
+        raise PartialResponseError(response, f"Dropped {dropped} malformed rows")
+    except PartialResponseError:
+        raise
+    except ValueError as e:
+        logger.debug(f"Full JSON parse failed ({e}), recovering complete rows")
+
+    recovered = {kind: recover_rows(text, kind) for kind in KINDS}
+    n_rows = sum(len(rows) for rows in recovered.values())
+    if not n_rows:
+        raise ValueError("No usable JSON in model response")
+    raise PartialResponseError(recovered, f"Recovered {n_rows} rows from a malformed response")
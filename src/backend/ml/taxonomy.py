@@ -0,0 +1,159 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Optional
+
+# Import path configuration
+from config.path_config import TAXONOMY_STORE
+# Import ML configuration
+from src.backend.ml.config_ml import TAXONOMY_TOP_K, TAXONOMY_MAX_LABELS, TAXONOMY_MERGE_RATIO, TAXONOMY_HALF_LIFE_DAYS
+# Import async classification engine
+from src.backend.ml.classifier_engine import TOPIC_KEYS
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+
+class TaxonomyStore:
+    # Drop-in replacement for TopicState that keeps the prompt a constant size. Labels are
+    # canonicalized (near-identical spellings fold into the first label seen), counted, and
+    # each prompt only gets the top_k labels per list, ranked by frequency and by how much
+    # the label overlaps the text of the batch being classified.
+    #
+    # Counts decay with a half-life of half_life_days since a label was last seen, and both the
+    # ranking and eviction use the decayed weight, so the store follows the current topics: a
+    # label nobody has used for weeks gives way to a new one. Labels seen in the batch being
+    # merged are never the ones evicted.
+    def __init__(
+        self,
+        path: Optional[str | Path] = TAXONOMY_STORE,
+        top_k: int = TAXONOMY_TOP_K,
+        max_labels: int = TAXONOMY_MAX_LABELS,
+        merge_ratio: float = TAXONOMY_MERGE_RATIO,
+        half_life_days: float = TAXONOMY_HALF_LIFE_DAYS,
+    ):
+        self.path = Path(path) if path else None
+        self.top_k = top_k
+        self.max_labels = max_labels
+        self.merge_ratio = merge_ratio
+        self.half_life = half_life_days * 86400
+        self.labels: dict[str, dict[str, dict]] = {key: {} for key in TOPIC_KEYS}
+        self.aliases: dict[str, dict[str, str]] = {key: {} for key in TOPIC_KEYS}
+        self.version = 0
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            self.load()
+
+    @staticmethod
+    def normalize(label: str) -> str:
+        label = unicodedata.normalize("NFC", str(label)).lower()
+        label = re.sub(r"\s+", " ", label)
+        return label.strip(" .,-_/'\"")
+
+    @staticmethod
+    def bigrams(text: str) -> set[str]:
+        text = re.sub(r"\s+", "", str(text).lower())
+        return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+    def canonical(self, key: str, label: str) -> Optional[str]:
+        normalized = self.normalize(label)
+        if not normalized:
+            return None
+        if normalized in self.aliases[key]:
+            return self.aliases[key][normalized]
+        for existing in self.labels[key]:
+            existing_normalized = self.normalize(existing)
+            if abs(len(existing_normalized) - len(normalized)) > 3:
+                continue
+            if SequenceMatcher(None, existing_normalized, normalized).ratio() >= self.merge_ratio:
+                self.aliases[key][normalized] = existing
+                self.labels[key][existing]["aliases"].append(label)
+                return existing
+        self.aliases[key][normalized] = label
+        self.labels[key][label] = {"count": 0, "last_seen": time.time(), "aliases": []}
+        return label
+
+    def weight(self, entry: dict, now: float) -> float:
+        # "count" is stored as of "last_seen" and decays from there
+        age = max(now - entry["last_seen"], 0.0)
+        return entry["count"] * 0.5 ** (age / self.half_life)
+
+    def add(self, key: str, label: str, now: float) -> Optional[str]:
+        canonical = self.canonical(key, label)
+        if canonical is not None:
+            entry = self.labels[key][canonical]
+            entry["count"] = self.weight(entry, now) + 1
+            entry["last_seen"] = now
+        return canonical
+
+    def merge(self, response: dict) -> None:
+        # rewrites the response labels to their canonical form in place
+        now = time.time()
+        with self._lock:
+            for kind in ("faq", "issue"):
+                for row in response.get(kind, []):
+                    for field in ("topic", "subtopic"):
+                        canonical = [self.add(f"{kind}_{field}", label, now) for label in row.get(field, [])]
+                        row[field] = list(dict.fromkeys(label for label in canonical if label))
+            for key in TOPIC_KEYS:
+                self._evict(key, now)
+            self.version += 1
+
+    def _evict(self, key: str, now: float) -> None:
+        overflow = len(self.labels[key]) - self.max_labels
+        if overflow <= 0:
+            return
+        # the labels of this batch were just seen; the stalest of the others make room
+        candidates = [label for label, entry in self.labels[key].items() if entry["last_seen"] < now]
+        rarest = sorted(candidates, key=lambda label: self.weight(self.labels[key][label], now))[:overflow]
+        for label in rarest:
+            del self.labels[key][label]
+        self.aliases[key] = {alias: label for alias, label in self.aliases[key].items() if label in self.labels[key]}
+
+    def snapshot(self, rows: Optional[list[dict]] = None) -> dict[str, list[str]]:
+        batch_grams = self.bigrams(" ".join(str(row["tweetText"]) for row in rows)) if rows else set()
+        now = time.time()
+        with self._lock:
+            snapshot = {}
+            for key in TOPIC_KEYS:
+                def score(label: str) -> float:
+                    frequency = math.log1p(self.weight(self.labels[key][label], now))
+                    if not batch_grams:
+                        return frequency
+                    grams = self.bigrams(label)
+                    return frequency * (1 + 2 * len(grams & batch_grams) / len(grams))
+                snapshot[key] = sorted(self.labels[key], key=score, reverse=True)[:self.top_k]
+            return snapshot
+
+    def load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        loaded = time.time()
+        for key in TOPIC_KEYS:
+            self.labels[key] = data.get(key, {})
+            for entry in self.labels[key].values():
+                # stores written before decay existed start their clock now
+                entry.setdefault("last_seen", loaded)
+            self.aliases[key] = {self.normalize(label): label for label in self.labels[key]}
+            for label, entry in self.labels[key].items():
+                for alias in entry["aliases"]:
+                    self.aliases[key][self.normalize(alias)] = label
+        logger.info(f"Loaded topic taxonomy with {sum(len(labels) for labels in self.labels.values())} labels from {self.path}")
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(self.path.parent, exist_ok=True)
+        with self._lock:
+            data = {key: self.labels[key] for key in TOPIC_KEYS}
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
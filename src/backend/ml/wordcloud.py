@@ -1,8 +1,18 @@
 import os, json
+import threading
+from typing import Optional
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from src.backend.ml.config_ml import instruction, prompt_template
+from src.backend.ml.config_ml import FAST_TIER_ENABLED, NEAR_DUP_ENABLED
+# Import async classification engine
+from src.backend.ml.classifier_engine import AsyncClassificationEngine, RateLimiter, run_sync
+# Import classifier backends
+from src.backend.ml.backends import ClassifierBackend, KeywordBackend, get_backend
+# Import classification cache
+from src.backend.ml.classification_cache import ClassificationCache
+# Import topic taxonomy
+from src.backend.ml.taxonomy import TaxonomyStore
+# Import near-duplicate clustering
+from src.backend.ml.near_duplicate import NearDuplicateClusterer
 import pandas as pd
 import hashlib
 
@@ -18,30 +28,25 @@ logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
 load_dotenv()
 
 class WordCloud:
-    def __init__(self):
-        self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    
-    def classify_messages(self, tweets_eles: list, faq_topic: str, faq_subtopic: str, issue_topic: str, issue_subtopic: str ) -> dict:
-        prompt_formatted = prompt_template.format(
-            faq_topic = faq_topic,
-            faq_subtopic = faq_subtopic,
-            issue_topic = issue_topic,
-            issue_subtopic = issue_subtopic,
-            messages="\n".join([f"{row['index']}: {row['tweetText']}" for row in tweets_eles]),
-        )
-        response = self.client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt_formatted,
-            config=types.GenerateContentConfig(
-                system_instruction=instruction,
-                temperature=0.2, # low temperature for more deterministic output kub
-            ),
-        )
-        response_text = response.text
-        response_json = response_text[response_text.index("{"): response_text.rindex("}") + 1]
-        response_json = response_json.replace("{{", "{").replace("}}", "}")
-        response_json = json.loads(response_json, strict=False)
-        return response_json
+    _shared: Optional["WordCloud"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, backend: ClassifierBackend = None):
+        self.cache = ClassificationCache()
+        self.backend = backend or get_backend(cache=self.cache)
+        self.fast_tier = None
+        if FAST_TIER_ENABLED and not isinstance(self.backend, KeywordBackend):
+            self.fast_tier = KeywordBackend.shared(self.cache)
+        self.clusterer = NearDuplicateClusterer() if NEAR_DUP_ENABLED else None
+        self.taxonomy = TaxonomyStore()
+
+    @classmethod
+    def shared(cls) -> "WordCloud":
+        # the flows classify tag by tag; the cache, backend and taxonomy are opened once per process
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
     
     def remove_stop_words_from_text(self, text, stop_words):
         if isinstance(text, list):
@@ -50,50 +55,101 @@ class WordCloud:
             return ' '.join(word for word in text.split() if word not in stop_words)
         return text
     
+    @staticmethod
+    def results_from_responses(completed: list[tuple[list[dict], dict]]) -> dict[str, dict]:
+        # One result per tweet that was sent; tweets the model skipped are kept as unclassified
+        key_by_index = {row['index']: row['cache_key'] for rows, _ in completed for row in rows}
+        results = {key: {"faq": None, "issue": None} for key in key_by_index.values()}
+        for _, response in completed:
+            for kind in ("faq", "issue"):
+                for row in response.get(kind, []):
+                    try:
+                        key = key_by_index.get(int(row['index']))
+                    except (KeyError, TypeError, ValueError):
+                        key = None
+                    if key is None:
+                        logger.debug(f"Dropping {kind} row with unknown index: {row}")
+                        continue
+                    entry = results[key][kind] or {"topic": [], "subtopic": []}
+                    entry["topic"] += [topic for topic in row.get('topic', []) if topic not in entry["topic"]]
+                    entry["subtopic"] += [subtopic for subtopic in row.get('subtopic', []) if subtopic not in entry["subtopic"]]
+                    results[key][kind] = entry
+        return results
+
+    def representative_keys(self, df_miss: pd.DataFrame) -> pd.Series:
+        # cache key of each tweet's near-duplicate cluster representative
+        if self.clusterer is None or df_miss.empty:
+            return df_miss['cache_key']
+        positions = self.clusterer.cluster(df_miss['tweetText'].tolist())
+        rep_keys = pd.Series(df_miss['cache_key'].to_numpy()[positions], index=df_miss.index)
+        n_reps = rep_keys.nunique()
+        logger.info(
+            f"Near-duplicate collapsing: {len(df_miss)} tweets -> {n_reps} representatives "
+            f"(compression ratio {len(df_miss) / n_reps:.2f}x)"
+        )
+        return rep_keys
+
     def classify(self, df: pd.DataFrame):
         df['tweetText'] = df['tweetText'].str.replace(r'#\S+', '', regex=True).str.strip()
         df.sort_values(by=['postTimeRaw'], ascending=True, inplace=True)
         df.drop_duplicates(subset="tweetText", inplace=True)
         df['index'] = df.index + 1
-        df_dict:dict = df[['postTimeRaw', 'tweetText', 'index']].to_dict(orient='records')
-        step = 20
-        prev_stop = 0
-
-        all_response = []
-        faq_topic, faq_subtopic = set(), set()
-        issue_topic, issue_subtopic = set(), set()
-        
-        for ind in range(step, len(df_dict) + step, step):
-            start = prev_stop
-            stop = ind
-            prev_stop = stop
-            rows = df_dict[start:stop]
-            logger.info(f"Processing rows {start} to {stop}")
-            
-            response = self.classify_messages(tweets_eles=rows, faq_topic=faq_topic, faq_subtopic=faq_subtopic, issue_topic=issue_topic, issue_subtopic=issue_subtopic)
-            
-            for row in response['issue']:
-                for topic in row['topic']:
-                    issue_topic.add(topic)
-                for subtopic in row['subtopic']:
-                    issue_subtopic.add(subtopic)
-            for row in response['faq']:
-                for topic in row['topic']:
-                    faq_topic.add(topic)
-                for subtopic in row['subtopic']:
-                    faq_subtopic.add(subtopic)
-            
-            all_response.append(response)
-        faqs = [faq for response in all_response for faq in response['faq']]
-        faqs_df = pd.DataFrame(faqs)
-        logger.info(f"df.columns: {df.columns.tolist()}")
-        logger.info(f"faqs_df.columns: {faqs_df.columns.tolist()}")
-        faqs_df = faqs_df.merge(
-            df[['index', 'tag', 'username', 'postTimeRaw', 'year', 'month', 'day']],
-            how='left',
-            on='index'
+        cache_keys = df['tweetText'].map(ClassificationCache.key)
+
+        # Only tweets that were never classified before go to the model
+        results = self.cache.get_many(cache_keys.tolist())
+        df_miss = df.assign(cache_key=cache_keys)[~cache_keys.isin(list(results))]
+
+        # Copy-paste spam and lightly edited reposts are classified once, through their representative
+        rep_keys = self.representative_keys(df_miss)
+        df_rep = df_miss[df_miss['cache_key'] == rep_keys]
+        df_dict:dict = df_rep[['postTimeRaw', 'tweetText', 'index', 'cache_key']].to_dict(orient='records')
+
+        texts = dict(zip(df_miss['cache_key'], df_miss['tweetText']))
+        members = dict(zip(df_miss['cache_key'], rep_keys))
+
+        def fan_out(rep_results: dict[str, dict]) -> dict[str, dict]:
+            return {key: rep_results[rep] for key, rep in members.items() if rep in rep_results}
+
+        if df_dict and self.fast_tier is not None:
+            # Tweets close to something the model already labelled are settled on CPU
+            settled, df_dict = self.fast_tier.settle(df_dict)
+            key_by_index = dict(zip(df_rep['index'], df_rep['cache_key']))
+            fast_results = fan_out({key_by_index[index]: result for index, result in settled.items()})
+            logger.info(f"Fast tier settled {len(settled)} tweets, {len(df_dict)} ambiguous go to {self.backend.name}")
+            self.cache.put_many(fast_results, texts, source=self.fast_tier.name)
+            results.update(fast_results)
+
+        if df_dict:
+            rate_limiter = RateLimiter() if self.backend.rate_limited else RateLimiter(10**9, 10**12)
+            engine = AsyncClassificationEngine(request_fn=self.backend.classify, rate_limiter=rate_limiter)
+
+            def checkpoint(batch: list[dict], response: dict) -> None:
+                # every finished batch goes to the cache right away, so a crashed run resumes from here
+                new_results = fan_out(self.results_from_responses([(batch, response)]))
+                self.cache.put_many(new_results, texts, source=self.backend.name)
+                results.update(new_results)
+
+            try:
+                # tweets that could not be classified fail the run instead of going missing: the
+                # finished batches are already in the cache, so a retry only sends the rest
+                run_sync(engine.run(df_dict, self.taxonomy, on_batch_done=checkpoint))
+            finally:
+                self.taxonomy.save()
+
+        stats = self.cache.stats()
+        logger.info(
+            f"Classification cache hit rate: {stats['hit_rate']:.1%} "
+            f"({stats['hits']} hits, {stats['misses']} misses, {stats['size']}/{stats['max_entries']} entries)"
         )
 
+        faq_results = cache_keys.map(lambda key: (results.get(key) or {}).get('faq'))
+        faqs_df = df.loc[faq_results.notna(), ['tweet_id', 'tweetText', 'tag', 'username', 'postTimeRaw', 'tweet_link', 'year', 'month', 'day']].copy()
+        faqs_df.insert(2, 'topic', faq_results.dropna().map(lambda faq: faq['topic']))
+        faqs_df.insert(3, 'subtopic', faq_results.dropna().map(lambda faq: faq['subtopic']))
+        faqs_df = faqs_df.reset_index(drop=True)
+        logger.info(f"faqs_df.columns: {faqs_df.columns.tolist()}")
+
         stop_word = list(
             set(
                 word
@@ -106,10 +162,6 @@ class WordCloud:
 
         faqs_df['topic'] = faqs_df['topic'].apply(lambda x: self.remove_stop_words_from_text(x, stop_word))
         faqs_df['subtopic'] = faqs_df['subtopic'].apply(lambda x: self.remove_stop_words_from_text(x, stop_word))
-        faqs_df = faqs_df.rename(columns={
-            "text": "tweetText"
-            })
-        faqs_df.drop(columns=['index'], inplace=True)
         return faqs_df
 
 if __name__ == "__main__":
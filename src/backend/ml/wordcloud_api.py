@@ -1,130 +1,279 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from datetime import datetime
+from collections import Counter, OrderedDict
 from typing import List, Optional
-import os, json
+import asyncio, hashlib, os, json, time, uuid
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from src.backend.ml.config_ml import instruction, prompt_template
+from src.backend.ml.config_ml import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_RESULT_CACHE_SIZE
+from src.backend.ml.backends import get_backend
+from src.backend.ml.classifier_engine import AsyncClassificationEngine, IncompleteClassificationError, RateLimiter
+from src.backend.ml.taxonomy import TaxonomyStore
+from config.path_config import lakefs_s3_path_ml_counts
 import uvicorn
 import pandas as pd
 from src.frontend.config_streamlit import random_color
 
 load_dotenv()
 
-app = FastAPI()
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
-faq_topic, faq_subtopic = set(), set()
-issue_topic, issue_subtopic = set(), set()
-
-def classify_messages(
-    tweets_eles: list,
-    faq_topic: str = faq_topic,
-    faq_subtopic: str = faq_subtopic,
-    issue_topic: str = issue_topic,
-    issue_subtopic: str = issue_subtopic
-    ) -> dict:
-    prompt_formatted = prompt_template.format(
-        faq_topic = faq_topic,
-        faq_subtopic = faq_subtopic,
-        issue_topic = issue_topic,
-        issue_subtopic = issue_subtopic,
-        messages="\n".join([f"{row['index']}: {row['tweetText']}" for row in tweets_eles]),
-    )
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=prompt_formatted,
-        config=types.GenerateContentConfig(
-            system_instruction=instruction,
-            temperature=0.2, # low temperature for more deterministic output kub
-        ),
-    )
-    response_text = response.text
-    response_json = response_text[response_text.index("{"): response_text.rindex("}") + 1]
-    response_json = response_json.replace("{{", "{").replace("}}", "}")
-    response_json = json.loads(response_json, strict=False)
-    return response_json
+backend = get_backend()
+# one limiter for every job, the quota belongs to the API key and not to a request
+rate_limiter = RateLimiter() if backend.rate_limited else RateLimiter(10**9, 10**12)
+
+
+def payload_hash(data_json: dict) -> str:
+    payload = json.dumps(data_json, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def naive_utc(value: datetime) -> pd.Timestamp:
+    # the counts table keeps its buckets as naive UTC; a window sent with an offset is moved to UTC
+    value = pd.Timestamp(value)
+    return value.tz_convert("UTC").tz_localize(None) if value.tzinfo is not None else value
+
 
 def remove_stopwords(word_list, stopwords):
     return [word for word in word_list if word not in stopwords]
 
-@app.post("/classify/")
-def classify(data_json: dict):
+
+class Job:
+    def __init__(self, key: str, payload: dict):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.payload = payload
+        self.status = "queued"
+        self.total = 0
+        self.done = 0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._changed = asyncio.Event()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("done", "partial", "failed")
+
+    def notify(self) -> None:
+        # wake every stream waiting on this job and arm a fresh event for the next change
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def next_change(self) -> asyncio.Event:
+        return self._changed
+
+    def state(self, with_result: bool = True) -> dict:
+        state = {"job_id": self.id, "status": self.status, "total": self.total, "done": self.done}
+        if self.error:
+            state["error"] = self.error
+        if with_result and self.status in ("done", "partial"):
+            state["result"] = self.result
+        return state
+
+
+class JobManager:
+    # Submitting returns straight away; JOB_WORKERS workers drain a bounded queue. Jobs are keyed
+    # by payload hash, so a payload that is queued, running or recently finished maps to the same
+    # job instead of being classified again. Finished jobs double as the result cache (LRU).
+    # A job where some tweets could not be classified ends "partial": it reports what it has,
+    # but an identical payload submitted later gets a fresh job instead of the incomplete result.
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE, max_finished: int = JOB_RESULT_CACHE_SIZE):
+        self.workers = workers
+        self.queue: asyncio.Queue[Job] = asyncio.Queue(maxsize=queue_size)
+        self.max_finished = max_finished
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self.by_key: dict[str, str] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            self.jobs.move_to_end(job_id)
+        return job
+
+    def submit(self, data_json: dict) -> Job:
+        key = payload_hash(data_json)
+        existing = self.get(self.by_key.get(key, ""))
+        if existing is not None and existing.status not in ("failed", "partial"):
+            return existing
+        job = Job(key, data_json)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=429, detail="Classification queue is full, try again later")
+        self.jobs[job.id] = job
+        self.by_key[key] = job.id
+        self._evict()
+        return job
+
+    def _evict(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            job = self.jobs.pop(job_id)
+            if self.by_key.get(job.key) == job_id:
+                del self.by_key[job.key]
+
+    async def worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            job.status = "running"
+            job.notify()
+            try:
+                job.result = await classify_job(job)
+                job.status = "partial" if job.error else "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished = time.time()
+                job.payload = None
+                job.notify()
+                self.queue.task_done()
+
+
+def prepare_rows(data_json: dict) -> tuple[pd.DataFrame, list[dict]]:
     df = pd.DataFrame(data_json['df'])
     df['tweetText'] = df['tweetText'].str.replace(r'#\S+', '', regex=True).str.strip()
-    df['postTimeRaw'] = pd.to_datetime(df['postTimeRaw'], errors='coerce') 
+    df['postTimeRaw'] = pd.to_datetime(df['postTimeRaw'], errors='coerce')
     df.sort_values(by=['postTimeRaw'], ascending=True, inplace=True)
-    df.drop_duplicates(subset="tweetText")
+    df = df.drop_duplicates(subset="tweetText")
     df['index'] = df.index + 1
     df['postTimeRaw'] = df['postTimeRaw'].dt.strftime('%Y-%m-%d')
     df_dict:dict = df[['postTimeRaw', 'tweetText', 'index']].to_dict(orient='records')
-    step = 50
-    prev_stop = 0
-
-    all_response = []
-
-    for ind in range(step, len(df_dict) + step, step):
-        start = prev_stop
-        stop = ind
-        prev_stop = stop
-        rows = df_dict[start:stop]
-        print(f"Processing rows {start} to {stop}")
-        
-        response = classify_messages(rows)
-        
-        # Update the set with new issues and FAQs
-        for row in response['issue']:
-            for topic in row['topic']:
-                issue_topic.add(topic)
-            for subtopic in row['subtopic']:
-                issue_subtopic.add(subtopic)
-        for row in response['faq']:
-            for topic in row['topic']:
-                faq_topic.add(topic)
-            for subtopic in row['subtopic']:
-                faq_subtopic.add(subtopic)
-        
-        all_response.append(response)
-    faqs = [faq for response in all_response for faq in response['faq']]
-    faqs_df = pd.DataFrame(faqs)
-    stop_word = list(
-        set(
-            word
-            for tags in df['tag'].dropna()
-            for word in tags.split("#")
-            if word.strip() 
-        )
+    return df, df_dict
+
+
+def word_counts(completed: list[tuple[list[dict], dict]], df: pd.DataFrame, by_topic: bool) -> list[dict]:
+    faqs = [faq for _, response in completed for faq in response.get('faq', [])]
+    faqs_df = pd.DataFrame(faqs, columns=['index', 'text', 'topic', 'subtopic'])
+    stop_word = set(
+        word
+        for tags in df['tag'].dropna()
+        for word in tags.split("#")
+        if word.strip()
     )
 
-    all_faq_topics_list = faqs_df['topic'].explode().values.tolist()
-    all_faq_subtopics_list = faqs_df['subtopic'].explode().values.tolist()
-
-    if data_json['topic']:
-        filtered_faq_topics = remove_stopwords(all_faq_topics_list, stop_word)
-        result = [
-            {
-                "name": topic, 
-                "value": filtered_faq_topics.count(topic),
-                "textStyle": {
-                    "color": random_color() 
-                }
+    column = 'topic' if by_topic else 'subtopic'
+    counts = Counter(remove_stopwords(faqs_df[column].explode().dropna().tolist(), stop_word))
+    return [
+        {
+            "name": topic,
+            "value": count,
+            "textStyle": {
+                "color": random_color()
+            }
+        }
+        for topic, count in counts.items()
+    ]
+
+
+async def classify_job(job: Job) -> list[dict]:
+    # the pandas work and the taxonomy file load run on threads, the loop only waits on the model
+    df, df_dict = await asyncio.to_thread(prepare_rows, job.payload)
+    job.total = len(df_dict)
+    job.notify()
+
+    def on_batch_done(batch: list[dict], response: dict) -> None:
+        job.done += len(batch)
+        job.notify()
+
+    # every job starts from the persisted taxonomy and never saves, so requests cannot see each other's labels
+    topics = await asyncio.to_thread(TaxonomyStore)
+    engine = AsyncClassificationEngine(request_fn=backend.classify, rate_limiter=rate_limiter)
+    try:
+        completed = await engine.run(df_dict, topics, on_batch_done=on_batch_done)
+    except IncompleteClassificationError as e:
+        if not e.completed:
+            raise
+        # counts from the tweets that did get labels, reported with what is missing
+        completed = e.completed
+        job.error = str(e)
+    return await asyncio.to_thread(word_counts, completed, df, job.payload['topic'])
+
+
+jobs = JobManager()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    jobs.start()
+    yield
+    await jobs.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.post("/classify/", status_code=202)
+async def classify(data_json: dict):
+    job = jobs.submit(data_json)
+    return job.state(with_result=False)
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.state()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+
+    async def stream():
+        # server-sent events: one progress message per change, the last one carries the result
+        while True:
+            changed = job.next_change()
+            yield f"data: {json.dumps(job.state(), ensure_ascii=False)}\n\n"
+            if job.is_finished:
+                return
+            await changed.wait()
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.get("/wordcloud/")
+def wordcloud(tags: List[str] = Query(...), start: datetime = Query(...), end: datetime = Query(...), topic: bool = False):
+    # already classified data: read the counts the pipeline materialized instead of re-counting tweets
+    storage_options = {
+        "key": os.getenv("ACCESS_KEY"),
+        "secret": os.getenv("SECRET_KEY"),
+        "client_kwargs": {
+            "endpoint_url": os.getenv("LAKEFS_ENDPOINT", "http://lakefsdb:8000")
+        }
+    }
+    counts = pd.read_parquet(
+        lakefs_s3_path_ml_counts,
+        columns=['tag', 'bucket', 'level', 'label', 'count'],
+        filters=[('level', '==', 'topic' if topic else 'subtopic'), ('tag', 'in', tags)],
+        storage_options=storage_options,
+        engine='pyarrow',
+    )
+    start, end = naive_utc(start), naive_utc(end)
+    counts = counts[(counts['bucket'] >= start.floor('15min')) & (counts['bucket'] <= end)]
+    counts = counts.groupby('label')['count'].sum()
+    return [
+        {
+            "name": label,
+            "value": int(count),
+            "textStyle": {
+                "color": random_color()
             }
-            for topic in set(filtered_faq_topics)
-        ]
-    else:
-        filtered_faq_subtopics = remove_stopwords(all_faq_subtopics_list, stop_word)
-        result = [
-            {
-                "name": topic, 
-                "value": filtered_faq_subtopics.count(topic),
-                "textStyle": {
-                    "color": random_color() 
-                }
-            } 
-            for topic in set(filtered_faq_subtopics)
-        ]
-
-    return result
+        }
+        for label, count in counts.items()
+    ]
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+# Import path configuration
+from config.path_config import RUN_CHECKPOINTS
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+
+class RunCheckpoint:
+    # Durable progress of one long flow run, kept on local disk so a run that fails part way
+    # can be started again and pick up where it stopped:
+    #   manifest.json            run id, tag set, and what has been done so far
+    #   tags/<md5 of tag>.parquet  each tag's tweets, written as soon as the tag is scraped
+    #   classified.parquet       the word-cloud output for the whole batch
+    # Uploads are recorded per table and partition ("year=/month=/day=" keys). The run id goes
+    # into the uploaded file names, so a partition that was half written when the run died is
+    # overwritten on resume instead of duplicated.
+    #
+    # A checkpoint belongs to one tag set: when the configured tags change, the old one is
+    # discarded. finish() removes it once everything is stored.
+    def __init__(self, name: str, tags: dict[str, list[str]], root: str | Path = RUN_CHECKPOINTS):
+        self.dir = Path(root) / name
+        self.manifest_path = self.dir / "manifest.json"
+        self.tag_set = sorted(tag for tag_list in tags.values() for tag in tag_list)
+        self._lock = threading.Lock()
+        self.manifest = self.load()
+
+    def load(self) -> dict:
+        if self.manifest_path.exists():
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("tag_set") == self.tag_set:
+                logger.info(
+                    f"Resuming run {manifest['run_id']}: {len(manifest['tags'])} of {len(self.tag_set)} tags scraped, "
+                    f"classified: {manifest['classified']}, uploaded: "
+                    f"{ {table: len(keys) for table, keys in manifest['uploaded'].items()} }"
+                )
+                return manifest
+            logger.info(f"Tags changed since run {manifest['run_id']}, discarding its checkpoint.")
+            shutil.rmtree(self.dir)
+        return {
+            "run_id": datetime.now().strftime("%Y%m%dT%H%M%S"),
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "tag_set": self.tag_set,
+            "tags": {},
+            "classified": False,
+            "uploaded": {},
+        }
+
+    def save(self) -> None:
+        os.makedirs(self.dir, exist_ok=True)
+        with self._lock:
+            manifest = json.loads(json.dumps(self.manifest))
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @property
+    def run_id(self) -> str:
+        return self.manifest["run_id"]
+
+    def tag_path(self, tag: str) -> Path:
+        return self.dir / "tags" / f"{hashlib.md5(tag.encode('utf-8')).hexdigest()}.parquet"
+
+    def is_scraped(self, tag: str) -> bool:
+        return tag in self.manifest["tags"]
+
+    def save_tag(self, category: str, tag: str, data: Optional[pd.DataFrame]) -> None:
+        # the file is in place before the manifest names it, so a listed tag is always readable
+        rows = 0 if data is None else len(data)
+        if rows:
+            path = self.tag_path(tag)
+            os.makedirs(path.parent, exist_ok=True)
+            data.to_parquet(path, index=False)
+        with self._lock:
+            self.manifest["tags"][tag] = {"category": category, "rows": rows}
+        self.save()
+        logger.info(f"Checkpointed {tag}: {rows} tweets")
+
+    def tweets(self) -> pd.DataFrame:
+        frames = [pd.read_parquet(self.tag_path(tag)) for tag, entry in self.manifest["tags"].items() if entry["rows"]]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def classified(self) -> Optional[pd.DataFrame]:
+        if not self.manifest["classified"]:
+            return None
+        return pd.read_parquet(self.dir / "classified.parquet")
+
+    def save_classified(self, data: pd.DataFrame) -> None:
+        data.to_parquet(self.dir / "classified.parquet", index=False)
+        self.manifest["classified"] = True
+        self.save()
+
+    def is_uploaded(self, table: str, key: str) -> bool:
+        return key in self.manifest["uploaded"].get(table, [])
+
+    def mark_uploaded(self, table: str, key: str) -> None:
+        with self._lock:
+            self.manifest["uploaded"].setdefault(table, []).append(key)
+        self.save()
+
+    def finish(self) -> None:
+        logger.info(f"Run {self.run_id} complete, removing its checkpoint.")
+        shutil.rmtree(self.dir, ignore_errors=True)
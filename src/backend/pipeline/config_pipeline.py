@@ -0,0 +1,33 @@
+import os
+
+# Adaptive tag scheduling (scheduler.py): the incremental deployment ticks every
+# SCHEDULE_CYCLE_MINUTES and each run scrapes only the tags that are due
+SCHEDULE_CYCLE_MINUTES = int(os.getenv("SCHEDULE_CYCLE_MINUTES", "5"))
+# A tag is revisited when about this many new posts are expected, roughly one scroll of results
+SCHEDULE_TARGET_POSTS = float(os.getenv("SCHEDULE_TARGET_POSTS", "20"))
+SCHEDULE_MIN_INTERVAL_MINUTES = int(os.getenv("SCHEDULE_MIN_INTERVAL_MINUTES", "5"))
+SCHEDULE_MAX_INTERVAL_MINUTES = int(os.getenv("SCHEDULE_MAX_INTERVAL_MINUTES", str(24 * 60)))
+# A tag planned by a run is not planned again until that run records it, or until this long has
+# passed, for a run that died without releasing its tags
+SCHEDULE_CLAIM_MINUTES = int(os.getenv("SCHEDULE_CLAIM_MINUTES", "60"))
+# Tag scrapes per hour across all tags; intervals are stretched evenly when the plan needs more
+SCHEDULE_BUDGET_PER_HOUR = float(os.getenv("SCHEDULE_BUDGET_PER_HOUR", "24"))
+# Weight of the newest arrival-rate sample in the per-tag moving average
+SCHEDULE_RATE_SMOOTHING = 0.3
+
+# Tag work queue (tag_queue.py): browsers scraping at once, seconds one tag may take before it
+# is cancelled, and the jittered pause a worker takes before pulling its next tag
+SCRAPE_WORKERS = int(os.getenv("SCRAPE_WORKERS", "3"))
+SCRAPE_TAG_TIMEOUT = float(os.getenv("SCRAPE_TAG_TIMEOUT", "300"))
+SCRAPE_WORKER_DELAY = float(os.getenv("SCRAPE_WORKER_DELAY", "10"))
+
+# Stage pipeline (stages.py): items a queue between two stages holds before the upstream
+# stage has to wait
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+
+# Task result cache (task_cache.py): how long a cached result is reused for the same input.
+# Tag URLs only change with the tag list; classification is the expensive call to the model.
+CACHE_HOURS_ENCODE_TAGS = float(os.getenv("CACHE_HOURS_ENCODE_TAGS", str(30 * 24)))
+CACHE_HOURS_TO_DATAFRAME = float(os.getenv("CACHE_HOURS_TO_DATAFRAME", "24"))
+CACHE_HOURS_VALIDATE = float(os.getenv("CACHE_HOURS_VALIDATE", "24"))
+CACHE_HOURS_WORDCLOUD = float(os.getenv("CACHE_HOURS_WORDCLOUD", str(7 * 24)))
@@ -13,94 +13,214 @@ from src.backend.validation.validate import ValidationPydantic, TweetData
 # Import modern logging configuration
 from config.logging.modern_log import LoggingConfig
 # Import path configuration
-from config.path_config import tags, lakefs_s3_path_ml
+from config.path_config import tags, lakefs_s3_path, lakefs_s3_path_ml, lakefs_s3_path_ml_counts, lakefs_s3_path_tag_counts, tag_hash_path
 # Import wordcloud 
 from src.backend.ml.wordcloud import WordCloud
+# Import ML configuration
+from src.backend.ml.config_ml import CLASSIFIER_VERSION
+# Import label counts
+from src.backend.ml.label_counts import label_counts
+# Import tag counts
+from src.backend.load.tag_counts import tag_counts
+# Import catalog manifest
+from src.backend.load.catalog import build_catalog, merge_catalog, data_partitions
+# Import adaptive tag scheduler
+from src.backend.pipeline.scheduler import TagScheduler, utc_now
+# Import tag work queue
+from src.backend.pipeline.tag_queue import TagQueue, TagJob
+# Import stage pipeline
+from src.backend.pipeline.stages import StagePipeline, DONE
+# Import pipeline configuration
+from src.backend.pipeline.config_pipeline import (
+    SCHEDULE_CYCLE_MINUTES,
+    CACHE_HOURS_ENCODE_TAGS,
+    CACHE_HOURS_TO_DATAFRAME,
+    CACHE_HOURS_VALIDATE,
+    CACHE_HOURS_WORDCLOUD,
+)
+# Import task result cache
+from src.backend.pipeline.task_cache import cached, RESULT_ENV
 
 logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
 
-@task(name="generate word cloud")
+@task(name="generate word cloud", **cached(timedelta(hours=CACHE_HOURS_WORDCLOUD), version=CLASSIFIER_VERSION))
 def generate_wordcloud(df: pd.DataFrame) -> pd.DataFrame:
-    return WordCloud().classify(df=df)
+    return WordCloud.shared().classify(df=df)
 
 @task(name="load word cloud to lakefs")
 def load_wordcloud_to_lakefs(faqs_df: pd.DataFrame, lakefs_endpoint: str, lakefs_s3_path: str) -> None:
-    return LakeFSLoader(host=lakefs_endpoint).incremental_load(faqs_df, lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path, is_wordcloud=True)
-
-@task(name="encode tags")
+    loader = LakeFSLoader(host=lakefs_endpoint)
+    loader.incremental_load(faqs_df, lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path, is_wordcloud=True)
+    if faqs_df.empty:
+        return
+    if loader.exists(lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path_ml_counts):
+        # the days of this batch are recounted from what is stored, so a retry after a failure
+        # between the two writes still counts rows the first attempt appended
+        days = data_partitions(faqs_df)
+        stored = loader.read_columns(lakefs_endpoint, lakefs_s3_path, ['tag', 'postTimeRaw', 'topic', 'subtopic'], partitions=days)
+        loader.load_counts(label_counts(stored), lakefs_endpoint=lakefs_endpoint, partitions=days)
+    else:
+        # first run with a counts table: build it from everything classified so far
+        all_faqs_df = loader.read(lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path)
+        loader.load_counts(label_counts(all_faqs_df), lakefs_endpoint=lakefs_endpoint, overwrite=True)
+
+@task(name="plan tags")
+def plan_tags(tags: dict[str, list[str]], lakefs_endpoint: str, claim: str) -> dict[str, list[str]]:
+    # the due tags are claimed in the same write that plans them, so a run that starts before
+    # this one has finished plans around them
+    scheduler = TagScheduler()
+    scheduler.seed(LakeFSLoader.read_catalog(lakefs_endpoint=lakefs_endpoint))
+    planned = scheduler.due(tags)
+    scheduler.claim(planned, claim)
+    scheduler.save()
+    return planned
+
+@task(name="release tags")
+def release_tags(planned: dict[str, list[str]], claim: str) -> None:
+    scheduler = TagScheduler()
+    scheduler.release(planned, claim)
+    scheduler.save()
+
+@task(name="record scraped tags")
+def record_scraped_tags(planned: dict[str, list[str]], data: pd.DataFrame | None) -> None:
+    scheduler = TagScheduler()
+    scheduler.record(planned, data)
+    scheduler.save()
+
+@task(name="encode tags", **cached(timedelta(hours=CACHE_HOURS_ENCODE_TAGS)))
 def encode_tags(tags: dict[str, list[str]]) -> dict[str, dict[str, str]]:
     return XScraping().encode_tag_to_url(tags)
 
-@task(name="flatten results")
-def flatten_results(nested_results: list[list[dict]]) -> list[dict]:
-    return [entry for result in nested_results for entry in result]
-
-@task(name="data to dataframe")
+@task(name="data to dataframe", **cached(timedelta(hours=CACHE_HOURS_TO_DATAFRAME)))
 def to_dataframe(tweets: list[dict]) -> pd.DataFrame:
     return XScraping.to_dataframe(tweets)
 
-@task(name="validate dataframe")
+@task(name="validate dataframe", **cached(timedelta(hours=CACHE_HOURS_VALIDATE)))
 def validate_dataframe(data: pd.DataFrame) -> bool:
     validator = ValidationPydantic(TweetData)
     return validator.validate(df=data, scrape_new=True)
 
 @task(name="load to lakefs")
 def load_to_lakefs(data: pd.DataFrame, lakefs_endpoint: str = None) -> None:
-    LakeFSLoader(host=lakefs_endpoint).incremental_load(data=data, lakefs_endpoint=lakefs_endpoint)
+    loader = LakeFSLoader(host=lakefs_endpoint)
+    catalog = loader.read_catalog(lakefs_endpoint=lakefs_endpoint)
+    # duplicates are looked up in every day of the batch, whether or not the catalog lists it: an
+    # attempt that appended a new day and failed before writing the catalog left rows there
+    days = data_partitions(data)
+    loader.incremental_load(data=data, lakefs_endpoint=lakefs_endpoint, partitions=days)
+    # the catalog and the rollup are rebuilt for the days of this batch from what is stored, not
+    # from the rows this attempt appended: a retry after a failure between the writes finds its
+    # rows already stored and appends nothing, but still leaves both correct
+    stored = loader.read_partitions(lakefs_endpoint, lakefs_s3_path, ['tag', 'category', 'postTimeRaw'], partitions=days)
+    if catalog is not None and "partition_tags" in catalog:
+        loader.load_catalog(merge_catalog(catalog, build_catalog(stored)), lakefs_endpoint=lakefs_endpoint)
+    else:
+        # no catalog yet, or one written before it kept rows per tag and partition: describe every stored tweet
+        all_data = loader.read(lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path, columns=['tag', 'category', 'postTimeRaw', 'year', 'month', 'day'])
+        loader.load_catalog(build_catalog(all_data), lakefs_endpoint=lakefs_endpoint)
+    if loader.exists(lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path_tag_counts):
+        loader.load_counts(tag_counts(stored), lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path_tag_counts, partitions=days)
+    else:
+        # first run with a rollup table: build it from every stored tweet
+        all_data = loader.read(lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path, columns=['tag', 'postTimeRaw'])
+        loader.load_counts(tag_counts(all_data), lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path_tag_counts, overwrite=True)
 
 @task(name="scrape tag")
 async def scrape_tag(category: str, tag: str, tag_url: str, max_scrolls: int) -> list[dict]:
     return await XScraping().scrape_all_tweet_texts(category=category, tag=tag, tag_url=tag_url, max_scrolls=max_scrolls)
 
 @task(name="check hash", log_prints=True)
-def check_hash_task(df: pd.DataFrame, lakefs_endpoint: str) -> bool:
-    return LakeFSLoader(host=lakefs_endpoint).check_hash(df=df, lakefs_endpoint=lakefs_endpoint)
+def check_hash_task(df: pd.DataFrame, lakefs_endpoint: str, lakefs_s3_path_hash: str) -> bool:
+    return LakeFSLoader(host=lakefs_endpoint).check_hash(df=df, lakefs_endpoint=lakefs_endpoint, lakefs_s3_path_hash=lakefs_s3_path_hash, save=False)
+
+@task(name="save hash")
+def save_hash_task(df: pd.DataFrame, lakefs_endpoint: str, lakefs_s3_path_hash: str) -> None:
+    LakeFSLoader(host=lakefs_endpoint).save_hash(df=df, lakefs_endpoint=lakefs_endpoint, lakefs_s3_path_hash=lakefs_s3_path_hash)
 
 async def scrape_flow():
-    tag_urls = encode_tags(tags)
-    semaphore = asyncio.Semaphore(3)
-    delay_seconds = 30
     lakefs_endpoint = "http://lakefsdb:8000"
-
-    async def scrape_with_limit(category: str, tag: str, url: str):
-        async with semaphore:
-            return await scrape_tag(category=category, tag=tag, tag_url=url, max_scrolls=1)
-        
-    task_list = [
-        (category, tag, url)
-        for category, tag_url_dict in tag_urls.items()
-        for tag, url in tag_url_dict.items()
-    ]
-
-    all_results = []
-
-    for i in range(0, len(task_list), 3):
-        batch = task_list[i:i+3]
-        futures = [
-            scrape_with_limit(category, tag, url)
-            for category, tag, url in batch
-        ]
-        results = await asyncio.gather(*futures)
-        all_results.extend(results)
-
-        if i + 3 < len(task_list):
-            print(f"Completed batch {i//3 + 1}. Sleeping for {delay_seconds} seconds...")
-            await asyncio.sleep(delay_seconds)
-
-    all_tweets = flatten_results(all_results)
-    data = to_dataframe(all_tweets)
-    check_hash_status = check_hash_task(df=data, lakefs_endpoint=lakefs_endpoint)
-    if check_hash_status:
-        print(f"Changes detected. Hash not matched.")
-        is_valid = validate_dataframe(data=data)
-        if is_valid:
-            faqs_df = generate_wordcloud(df=data)
-            load_to_lakefs(data=data, lakefs_endpoint=lakefs_endpoint)
-            load_wordcloud_to_lakefs(faqs_df=faqs_df, lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path_ml)
-        else:
-            print("Validation failed, data not saved.")
-    else:
-        print(f"No changes detected. Hash matched.")
+    # each cycle scrapes only the tags whose next visit has come
+    claim = utc_now().isoformat(timespec="seconds")
+    planned = plan_tags(tags, lakefs_endpoint, claim)
+    if not planned:
+        print("No tag is due this cycle.")
+        return
+    try:
+        tag_urls = encode_tags(planned)
+        priorities = TagScheduler().priorities(planned)
+
+        # scrape -> validate -> load to lakeFS
+        #                    -> classify -> load word cloud
+        # every arrow is a bounded queue, so a tag's tweets are stored while later tags are still
+        # being scraped and classified, and a slow stage holds back the ones before it
+        pipeline = StagePipeline()
+        scraped, to_load, to_classify = pipeline.queue(), pipeline.queue(), pipeline.queue()
+
+        async def scrape_job(job: TagJob) -> list[dict]:
+            return await scrape_tag(category=job.category, tag=job.tag, tag_url=job.url, max_scrolls=1)
+
+        async def hand_off(job: TagJob, tweets: list[dict]) -> None:
+            await scraped.put((job, tweets))
+
+        async def scrape_all() -> None:
+            queue = TagQueue(scrape_job, sink=hand_off)
+            try:
+                await queue.run([
+                    TagJob(priorities[tag], category, tag, url)
+                    for category, tag_url_dict in tag_urls.items()
+                    for tag, url in tag_url_dict.items()
+                ])
+            finally:
+                await scraped.put(DONE)
+
+        # a tag's hash is written only once both its tweets and its word cloud are stored, so a
+        # tag whose load or classification failed is not skipped as unchanged next cycle
+        stored: dict[str, int] = {}
+
+        async def settle(job: TagJob, data: pd.DataFrame) -> None:
+            stored[job.tag] = stored.get(job.tag, 0) + 1
+            if stored[job.tag] == 2:
+                await asyncio.to_thread(save_hash_task, df=data, lakefs_endpoint=lakefs_endpoint, lakefs_s3_path_hash=tag_hash_path(job.tag))
+
+        async def validate(item: tuple[TagJob, list[dict]]) -> tuple[TagJob, pd.DataFrame] | None:
+            job, tweets = item
+            # tags that failed or timed out never get here, so they are due again next cycle
+            visited = {job.category: [job.tag]}
+            if not tweets:
+                await asyncio.to_thread(record_scraped_tags, visited, None)
+                return None
+            data = await asyncio.to_thread(to_dataframe, tweets)
+            await asyncio.to_thread(record_scraped_tags, visited, data)
+            if not await asyncio.to_thread(check_hash_task, df=data, lakefs_endpoint=lakefs_endpoint, lakefs_s3_path_hash=tag_hash_path(job.tag)):
+                print(f"No changes detected for {job.tag}. Hash matched.")
+                return None
+            if not await asyncio.to_thread(validate_dataframe, data=data):
+                print(f"Validation failed for {job.tag}, data not saved.")
+                return None
+            return job, data
+
+        async def load(item: tuple[TagJob, pd.DataFrame]) -> None:
+            job, data = item
+            await asyncio.to_thread(load_to_lakefs, data=data, lakefs_endpoint=lakefs_endpoint)
+            await settle(job, data)
+
+        async def classify(item: tuple[TagJob, pd.DataFrame]) -> None:
+            job, data = item
+            # the word cloud cleans its input in place, so it gets its own copy
+            faqs_df = await asyncio.to_thread(generate_wordcloud, df=data.copy())
+            await asyncio.to_thread(load_wordcloud_to_lakefs, faqs_df=faqs_df, lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path_ml)
+            await settle(job, data)
+
+        await asyncio.gather(
+            scrape_all(),
+            pipeline.stage("validate", scraped, validate, (to_load, to_classify)),
+            pipeline.stage("load", to_load, load),
+            pipeline.stage("classify", to_classify, classify),
+        )
+        pipeline.raise_errors()
+    finally:
+        # tags this run planned but did not record (failed, timed out) are due again next cycle
+        await asyncio.to_thread(release_tags, planned, claim)
 
 @flow(name="Incremental Scrape Flow", log_prints=True)
 def scrape_flow_wrapper():
@@ -112,10 +232,15 @@ if __name__ == "__main__":
         source=Path(__file__).parent,
         entrypoint="./incremental_scrape_flow.py:scrape_flow_wrapper",
     ).deploy(
+        # the original deployment name: deploying under it replaces that deployment's 15-minute
+        # schedule, where a new name would leave it running next to this one
         name="scrape-x-every-15m",
         work_pool_name="x-worker",
+        # a cycle that is still running when the next one is due holds it back, it never overlaps
+        concurrency_limit=1,
+        job_variables={"env": RESULT_ENV},
         schedule=Interval(
-            timedelta(minutes=15),
+            timedelta(minutes=SCHEDULE_CYCLE_MINUTES),
             timezone="Asia/Bangkok"
         )
     )
\ No newline at end of file
@@ -2,6 +2,7 @@ from prefect import flow, task
 import pandas as pd
 import os
 import asyncio
+from datetime import timedelta
 
 # Import XScraping for scraping
 from src.backend.scraping.x_scraping import XScraping
@@ -12,33 +13,53 @@ from src.backend.validation.validate import ValidationPydantic, TweetData
 # Import modern logging configuration
 from config.logging.modern_log import LoggingConfig
 # Import path configuration
-from config.path_config import tags, lakefs_s3_path_ml, repo_name_ml
+from config.path_config import tags, lakefs_s3_path, lakefs_s3_path_ml, lakefs_s3_path_tag_counts, repo_name, repo_name_ml
 # Import wordcloud 
 from src.backend.ml.wordcloud import WordCloud
+# Import ML configuration
+from src.backend.ml.config_ml import CLASSIFIER_VERSION
+# Import label counts
+from src.backend.ml.label_counts import label_counts
+# Import tag counts
+from src.backend.load.tag_counts import tag_counts
+# Import catalog manifest
+from src.backend.load.catalog import build_catalog, partition_key
+# Import tag work queue
+from src.backend.pipeline.tag_queue import TagQueue, TagJob
+# Import run checkpoint
+from src.backend.pipeline.checkpoint import RunCheckpoint
+# Import pipeline configuration
+from src.backend.pipeline.config_pipeline import (
+    CACHE_HOURS_ENCODE_TAGS,
+    CACHE_HOURS_TO_DATAFRAME,
+    CACHE_HOURS_VALIDATE,
+    CACHE_HOURS_WORDCLOUD,
+)
+# Import task result cache
+from src.backend.pipeline.task_cache import cached, result_settings
 
 logger = LoggingConfig(level="DEBUG", level_console="DEBUG").get_logger()
 
-@task(name="generate word cloud")
+@task(name="generate word cloud", **cached(timedelta(hours=CACHE_HOURS_WORDCLOUD), version=CLASSIFIER_VERSION))
 def generate_wordcloud(df: pd.DataFrame) -> pd.DataFrame:
     return WordCloud().classify(df=df)
 
-@task(name="load word cloud to lakefs")
-def load_wordcloud_to_lakefs(faqs_df: pd.DataFrame, lakefs_endpoint: str, lakefs_s3_path: str) -> None:
-    return LakeFSLoader(host=lakefs_endpoint).load(faqs_df, lakefs_endpoint=lakefs_endpoint, repo_name=repo_name_ml,lakefs_s3_path=lakefs_s3_path)
+@task(name="rebuild label counts")
+def rebuild_label_counts(lakefs_endpoint: str, lakefs_s3_path: str) -> None:
+    # rebuilt from the whole table so the counts always match what is stored
+    loader = LakeFSLoader(host=lakefs_endpoint)
+    all_faqs_df = loader.read(lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path)
+    loader.load_counts(label_counts(all_faqs_df), lakefs_endpoint=lakefs_endpoint, overwrite=True)
 
-@task(name="encode tags")
+@task(name="encode tags", **cached(timedelta(hours=CACHE_HOURS_ENCODE_TAGS)))
 def encode_tags(tags: dict[str, list[str]]) -> dict[str, dict[str, str]]:
     return XScraping().encode_tag_to_url(tags)
 
-@task(name="flatten results")
-def flatten_results(nested_results: list[list[dict]]) -> list[dict]:
-    return [entry for result in nested_results for entry in result]
-
-@task(name="data to dataframe")
+@task(name="data to dataframe", **cached(timedelta(hours=CACHE_HOURS_TO_DATAFRAME)))
 def to_dataframe(tweets: list[dict]) -> pd.DataFrame:
     return XScraping.to_dataframe(tweets)
 
-@task(name="validate dataframe")
+@task(name="validate dataframe", **cached(timedelta(hours=CACHE_HOURS_VALIDATE)))
 def validate_dataframe(data: pd.DataFrame) -> bool:
     validator = ValidationPydantic(TweetData)
     return validator.validate(data)
@@ -49,9 +70,18 @@ def save_to_csv(data: pd.DataFrame, path: str = "/root/flows/data/from_prefect/t
     data.to_csv(path, index=False)
     logger.info(f"CSV file saved to {path}")
 
-@task(name="load to lakefs")
-def load_to_lakefs(data: pd.DataFrame, lakefs_endpoint: str = None) -> None:
-    LakeFSLoader(host=lakefs_endpoint).load(data=data, lakefs_endpoint=lakefs_endpoint)
+@task(name="load partition to lakefs")
+def load_partition_to_lakefs(data: pd.DataFrame, lakefs_endpoint: str, run_id: str, repo_name: str, lakefs_s3_path: str) -> None:
+    loader = LakeFSLoader(host=lakefs_endpoint)
+    loader.create_repository(repo_name)
+    loader.load_partition(data, lakefs_endpoint=lakefs_endpoint, run_id=run_id, lakefs_s3_path=lakefs_s3_path)
+
+@task(name="rebuild catalog and tag counts")
+def rebuild_catalog(lakefs_endpoint: str) -> None:
+    loader = LakeFSLoader(host=lakefs_endpoint)
+    all_data = loader.read(lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path, columns=['tag', 'category', 'postTimeRaw', 'year', 'month', 'day'])
+    loader.load_catalog(build_catalog(all_data), lakefs_endpoint=lakefs_endpoint)
+    loader.load_counts(tag_counts(all_data), lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path_tag_counts, overwrite=True)
 
 @task(name="scrape tag")
 async def scrape_tag(category: str, tag: str, tag_url: str) -> list[dict]:
@@ -66,56 +96,71 @@ def unload_hash(df: pd.DataFrame, lakefs_endpoint: str) -> bool:
     return LakeFSLoader(host=lakefs_endpoint).load_hash(df=df, lakefs_endpoint=lakefs_endpoint)
 
 
+def load_partitions(data: pd.DataFrame, checkpoint: RunCheckpoint, table: str, lakefs_endpoint: str, repo_name: str, lakefs_s3_path: str) -> None:
+    # one partition at a time, each recorded once stored, so a resumed run uploads only the rest
+    for (year, month, day), partition in data.groupby(["year", "month", "day"], observed=True):
+        key = partition_key(year, month, day)
+        if checkpoint.is_uploaded(table, key):
+            continue
+        load_partition_to_lakefs(data=partition, lakefs_endpoint=lakefs_endpoint, run_id=checkpoint.run_id, repo_name=repo_name, lakefs_s3_path=lakefs_s3_path)
+        checkpoint.mark_uploaded(table, key)
+
+
 @flow(name="Initial Scrape Flow")
 async def scrape_flow():
     tag_urls = encode_tags(tags)
-    semaphore = asyncio.Semaphore(3)
-    delay_seconds = 30
     lakefs_endpoint = "http://lakefsdb:8000"
-
-    async def scrape_with_limit(category: str, tag: str, url: str):
-        async with semaphore:
-            return await scrape_tag(category=category, tag=tag, tag_url=url)
-        
-    task_list = [
-        (category, tag, url)
-        for category, tag_url_dict in tag_urls.items()
-        for tag, url in tag_url_dict.items()
-    ]
-
-    all_results = []
-
-    for i in range(0, len(task_list), 3):
-        batch = task_list[i:i+3]
-        futures = [
-            scrape_with_limit(category, tag, url)
-            for category, tag, url in batch
-        ]
-        results = await asyncio.gather(*futures)
-        all_results.extend(results)
-
-        if i + 3 < len(task_list):
-            logger.info(f"Completed batch {i//3 + 1}. Sleeping for {delay_seconds} seconds...")
-            await asyncio.sleep(delay_seconds)
-
-    all_tweets = flatten_results(all_results)
-    data = to_dataframe(all_tweets)
+    # a run that failed part way left its progress here; this run continues it
+    checkpoint = RunCheckpoint("initial_scrape", tags)
+
+    async def scrape_job(job: TagJob) -> list[dict]:
+        return await scrape_tag(category=job.category, tag=job.tag, tag_url=job.url)
+
+    async def save_tag(job: TagJob, tweets: list[dict]) -> None:
+        data = await asyncio.to_thread(to_dataframe, tweets) if tweets else None
+        await asyncio.to_thread(checkpoint.save_tag, job.category, job.tag, data)
+
+    # nothing is known about the tags yet, so they are scraped in configuration order
+    queue = TagQueue(scrape_job, sink=save_tag)
+    await queue.run([
+        TagJob((i,), category, tag, url)
+        for i, (category, tag, url) in enumerate(
+            (category, tag, url)
+            for category, tag_url_dict in tag_urls.items()
+            for tag, url in tag_url_dict.items()
+        )
+        if not checkpoint.is_scraped(tag)
+    ])
+    if queue.failed:
+        raise RuntimeError(f"{len(queue.failed)} tags failed: {sorted(queue.failed)}. Run the flow again to scrape only these.")
+
+    data = checkpoint.tweets()
     logger.info(f"Total tweets scraped: {len(data)}")
+    if data.empty:
+        logger.warning("No tweets scraped.")
+        checkpoint.finish()
+        return
 
     is_valid = validate_dataframe(data=data)
     is_valid = True
     if is_valid:
-        faqs_df = generate_wordcloud(df=data)
-        # save_to_csv(data)
-        # load_to_lakefs(data=data, lakefs_endpoint=lakefs_endpoint)
+        faqs_df = checkpoint.classified()
+        if faqs_df is None:
+            # the word cloud cleans its input in place
+            faqs_df = generate_wordcloud(df=data.copy())
+            checkpoint.save_classified(faqs_df)
         save_to_csv(data)
         unload_hash(df=data, lakefs_endpoint=lakefs_endpoint)
-        load_to_lakefs(data=data, lakefs_endpoint=lakefs_endpoint)
-        load_wordcloud_to_lakefs(faqs_df=faqs_df, lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path_ml)
+        load_partitions(data, checkpoint, "tweets", lakefs_endpoint, repo_name, lakefs_s3_path)
+        rebuild_catalog(lakefs_endpoint=lakefs_endpoint)
+        load_partitions(faqs_df, checkpoint, "wordcloud", lakefs_endpoint, repo_name_ml, lakefs_s3_path_ml)
+        rebuild_label_counts(lakefs_endpoint=lakefs_endpoint, lakefs_s3_path=lakefs_s3_path_ml)
+        checkpoint.finish()
     else:
         logger.warning("Validation failed, data not saved.")
 
     
 
 if __name__ == "__main__":
-    asyncio.run(scrape_flow())
\ No newline at end of file
+    with result_settings():
+        asyncio.run(scrape_flow())
\ No newline at end of file
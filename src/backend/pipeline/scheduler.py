@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+# Import path configuration
+from config.path_config import TAG_SCHEDULE
+# Import pipeline configuration
+from src.backend.pipeline.config_pipeline import (
+    SCHEDULE_TARGET_POSTS,
+    SCHEDULE_MIN_INTERVAL_MINUTES,
+    SCHEDULE_MAX_INTERVAL_MINUTES,
+    SCHEDULE_CLAIM_MINUTES,
+    SCHEDULE_BUDGET_PER_HOUR,
+    SCHEDULE_RATE_SMOOTHING,
+)
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+
+def utc_now() -> datetime:
+    # postTimeRaw is stored as naive UTC, so the schedule is kept in the same clock
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TagScheduler:
+    # Keeps an arrival-rate estimate (posts per hour) per tag and revisits a tag when about
+    # target_posts new posts are expected: hot tags every few minutes, quiet ones hourly or daily.
+    #
+    # Rates start from the catalog manifest (rows over the tag's stored time span) and are then
+    # refined by every scrape: the newest posts on a tag's search page span some time window,
+    # and posts / window is a sample of the current velocity, folded into a moving average.
+    #
+    # When the planned intervals together ask for more than budget_per_hour scrapes, every
+    # interval is stretched by the same factor, so the budget is spent in proportion to rate.
+    #
+    # A run claims the tags it plans ("in_flight" holds the run's claim), so a run that starts
+    # while another is still scraping does not plan the same tags. Recording a visit clears the
+    # claim, release() clears the claims of tags the run never got to, and a claim older than
+    # claim_timeout is ignored, so tags held by a run that died are not stuck.
+    def __init__(
+        self,
+        path: Optional[str | Path] = TAG_SCHEDULE,
+        target_posts: float = SCHEDULE_TARGET_POSTS,
+        min_interval: timedelta = timedelta(minutes=SCHEDULE_MIN_INTERVAL_MINUTES),
+        max_interval: timedelta = timedelta(minutes=SCHEDULE_MAX_INTERVAL_MINUTES),
+        budget_per_hour: float = SCHEDULE_BUDGET_PER_HOUR,
+        smoothing: float = SCHEDULE_RATE_SMOOTHING,
+        claim_timeout: timedelta = timedelta(minutes=SCHEDULE_CLAIM_MINUTES),
+    ):
+        self.path = Path(path) if path else None
+        self.target_posts = target_posts
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget_per_hour = budget_per_hour
+        self.smoothing = smoothing
+        self.claim_timeout = claim_timeout
+        self.tags: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            self.load()
+
+    def load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            self.tags = json.load(f)
+        logger.info(f"Loaded schedule for {len(self.tags)} tags from {self.path}")
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(self.path.parent, exist_ok=True)
+        with self._lock:
+            data = dict(self.tags)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def seed(self, catalog: Optional[dict]) -> None:
+        # tags never scraped under this scheduler start from their stored history
+        for tag, stats in (catalog or {}).get("tag_stats", {}).items():
+            state = self.tags.setdefault(tag, {"rate": None, "last_run": None})
+            if state["rate"] is not None:
+                continue
+            span = pd.Timestamp(stats["max_time"]) - pd.Timestamp(stats["min_time"])
+            hours = max(span.total_seconds() / 3600, 1.0)
+            state["rate"] = stats["rows"] / hours
+
+    def interval(self, rate: Optional[float], stretch: float = 1.0) -> timedelta:
+        if not rate:
+            return self.max_interval
+        interval = timedelta(hours=self.target_posts / rate) * stretch
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def intervals(self, tags: list[str]) -> dict[str, timedelta]:
+        rates = {tag: self.tags.get(tag, {}).get("rate") for tag in tags}
+        demand = sum(timedelta(hours=1) / self.interval(rate) for rate in rates.values())
+        stretch = max(demand / self.budget_per_hour, 1.0)
+        return {tag: self.interval(rate, stretch) for tag, rate in rates.items()}
+
+    def due(self, tags: dict[str, list[str]], now: Optional[datetime] = None) -> dict[str, list[str]]:
+        # the tags (category -> tags) whose next visit has come, hottest first
+        now = now or utc_now()
+        intervals = self.intervals([tag for tag_list in tags.values() for tag in tag_list])
+        planned = {}
+        for category, tag_list in tags.items():
+            due_tags = []
+            for tag in tag_list:
+                state = self.tags.get(tag, {})
+                if self.is_claimed(state, now):
+                    continue
+                last_run = state.get("last_run")
+                if last_run is None or datetime.fromisoformat(last_run) + intervals[tag] <= now:
+                    due_tags.append(tag)
+            if due_tags:
+                planned[category] = sorted(due_tags, key=lambda tag: -(self.tags.get(tag, {}).get("rate") or 0))
+        return planned
+
+    def is_claimed(self, state: dict, now: datetime) -> bool:
+        claim = state.get("in_flight")
+        return claim is not None and datetime.fromisoformat(claim) + self.claim_timeout > now
+
+    def claim(self, tags: dict[str, list[str]], claim: str) -> None:
+        with self._lock:
+            for tag in (tag for tag_list in tags.values() for tag in tag_list):
+                self.tags.setdefault(tag, {"rate": None, "last_run": None})["in_flight"] = claim
+
+    def release(self, tags: dict[str, list[str]], claim: str) -> None:
+        # only this run's claims: a tag another run has claimed since is left alone
+        with self._lock:
+            for tag in (tag for tag_list in tags.values() for tag in tag_list):
+                state = self.tags.get(tag, {})
+                if state.get("in_flight") == claim:
+                    del state["in_flight"]
+
+    def priorities(self, tags: dict[str, list[str]], now: Optional[datetime] = None) -> dict[str, tuple]:
+        # queue order inside a run: most posts expected to be waiting first, then earliest
+        # deadline; tags never visited come first of all
+        now = now or utc_now()
+        intervals = self.intervals([tag for tag_list in tags.values() for tag in tag_list])
+        priorities = {}
+        for tag in intervals:
+            state = self.tags.get(tag, {})
+            if state.get("last_run") is None:
+                priorities[tag] = (-float("inf"), 0.0)
+                continue
+            last_run = datetime.fromisoformat(state["last_run"])
+            expected = (state.get("rate") or 0) * (now - last_run).total_seconds() / 3600
+            priorities[tag] = (-expected, (last_run + intervals[tag] - now).total_seconds())
+        return priorities
+
+    def observe(self, tag: str, post_times: pd.Series, scraped_at: datetime) -> None:
+        with self._lock:
+            state = self.tags.setdefault(tag, {"rate": None, "last_run": None})
+            post_times = pd.to_datetime(post_times).dropna()
+            if len(post_times):
+                window = max((scraped_at - post_times.min()).total_seconds() / 3600, 1 / 60)
+                sample = len(post_times) / window
+            elif state["last_run"] is not None:
+                # nothing on the page: no post since at least the previous visit
+                sample = 0.0
+            else:
+                sample = None
+            if sample is not None:
+                rate = state["rate"]
+                state["rate"] = sample if rate is None else (1 - self.smoothing) * rate + self.smoothing * sample
+            state["last_run"] = scraped_at.isoformat(timespec="seconds")
+            state.pop("in_flight", None)
+
+    def record(self, tags: dict[str, list[str]], data: Optional[pd.DataFrame], scraped_at: Optional[datetime] = None) -> None:
+        # every scraped tag counts as visited, including the ones that returned nothing
+        scraped_at = scraped_at or utc_now()
+        by_tag = data.groupby("tag")["postTimeRaw"] if data is not None and len(data) else None
+        for tag in (tag for tag_list in tags.values() for tag in tag_list):
+            post_times = by_tag.get_group(tag) if by_tag is not None and tag in by_tag.groups else pd.Series(dtype="datetime64[ns]")
+            self.observe(tag, post_times, scraped_at)
+        intervals = self.intervals(list(self.tags))
+        for tag in (tag for tag_list in tags.values() for tag in tag_list):
+            rate = self.tags[tag]["rate"]
+            logger.info(f"Tag {tag}: {rate or 0:.2f} posts/h, next visit in {intervals[tag]}")
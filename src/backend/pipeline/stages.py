@@ -0,0 +1,47 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+# Import pipeline configuration
+from src.backend.pipeline.config_pipeline import PIPELINE_QUEUE_SIZE
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+# Put on a queue after its last item; a stage passes it on to its outboxes and stops
+DONE = object()
+
+
+class StagePipeline:
+    # Stages connected by bounded queues. Each stage takes one item at a time from its inbox
+    # and puts its handler's result on every outbox; when an outbox is full the stage waits,
+    # so a slow stage holds back the ones feeding it and memory stays at a few items per
+    # queue. A handler that returns None drops the item. A failing item is logged and the
+    # stage moves on; raise_errors() reports the failures once every stage has drained.
+    def __init__(self, queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.errors: list[str] = []
+
+    def queue(self) -> asyncio.Queue:
+        return asyncio.Queue(maxsize=self.queue_size)
+
+    async def stage(self, name: str, inbox: asyncio.Queue, handler: Callable[[Any], Awaitable[Any]], outboxes: tuple[asyncio.Queue, ...] = ()) -> None:
+        while True:
+            item = await inbox.get()
+            if item is DONE:
+                for outbox in outboxes:
+                    await outbox.put(DONE)
+                return
+            try:
+                result = await handler(item)
+            except Exception as e:
+                logger.error(f"Stage {name} failed: {e}", exc_info=True)
+                self.errors.append(f"{name}: {e}")
+                continue
+            if result is not None:
+                for outbox in outboxes:
+                    await outbox.put(result)
+
+    def raise_errors(self) -> None:
+        if self.errors:
+            raise RuntimeError(f"{len(self.errors)} pipeline items failed: {self.errors}")
@@ -0,0 +1,79 @@
+import asyncio
+import random
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+# Import pipeline configuration
+from src.backend.pipeline.config_pipeline import SCRAPE_WORKERS, SCRAPE_TAG_TIMEOUT, SCRAPE_WORKER_DELAY
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
+
+@dataclass(order=True)
+class TagJob:
+    # lower priority is scraped first
+    priority: tuple
+    category: str = field(compare=False)
+    tag: str = field(compare=False)
+    url: str = field(compare=False)
+
+
+class TagQueue:
+    # A shared priority queue drained by `workers` workers: a worker pulls the next tag as soon
+    # as its current one is done, so one slow tag holds up only its own worker. Each tag gets
+    # `timeout` seconds; a tag that runs over is cancelled and reported as failed. Between two
+    # tags a worker pauses for a jittered `delay`, which spaces requests to X per worker
+    # instead of per batch.
+    #
+    # With a sink, each tag's tweets are handed to it as soon as the tag is done instead of
+    # being kept; a sink that blocks (a full downstream queue) holds the worker back.
+    def __init__(
+        self,
+        scrape_fn: Callable[[TagJob], Awaitable[list[dict]]],
+        workers: int = SCRAPE_WORKERS,
+        timeout: float = SCRAPE_TAG_TIMEOUT,
+        delay: float = SCRAPE_WORKER_DELAY,
+        sink: Optional[Callable[[TagJob, list[dict]], Awaitable[None]]] = None,
+    ):
+        self.scrape_fn = scrape_fn
+        self.workers = workers
+        self.timeout = timeout
+        self.delay = delay
+        self.sink = sink
+        self.results: dict[str, list[dict]] = {}
+        self.failed: dict[str, str] = {}
+
+    async def worker(self, queue: asyncio.PriorityQueue) -> None:
+        while True:
+            try:
+                job = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                tweets = await asyncio.wait_for(self.scrape_fn(job), timeout=self.timeout)
+                logger.info(f"Tag {job.tag}: {len(tweets)} tweets ({queue.qsize()} tags left)")
+                if self.sink is None:
+                    self.results[job.tag] = tweets
+                else:
+                    await self.sink(job, tweets)
+            except asyncio.TimeoutError:
+                self.failed[job.tag] = f"timed out after {self.timeout:.0f}s"
+                logger.error(f"Tag {job.tag} timed out after {self.timeout:.0f}s")
+            except Exception as e:
+                self.failed[job.tag] = str(e)
+                logger.error(f"Tag {job.tag} failed: {e}")
+            finally:
+                queue.task_done()
+            if not queue.empty():
+                await asyncio.sleep(self.delay * random.uniform(0.5, 1.5))
+
+    async def run(self, jobs: list[TagJob]) -> dict[str, list[dict]]:
+        queue: asyncio.PriorityQueue[TagJob] = asyncio.PriorityQueue()
+        for job in jobs:
+            queue.put_nowait(job)
+        await asyncio.gather(*(self.worker(queue) for _ in range(min(self.workers, len(jobs)))))
+        if self.failed:
+            logger.warning(f"{len(self.failed)} of {len(jobs)} tags failed: {sorted(self.failed)}")
+        return self.results
@@ -0,0 +1,95 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+from prefect.cache_policies import CachePolicy, TASK_SOURCE
+from prefect.context import TaskRunContext
+from prefect.settings import PREFECT_LOCAL_STORAGE_PATH, temporary_settings
+from prefect.utilities.hashing import hash_objects
+
+# Import path configuration
+from config.path_config import TASK_RESULTS
+
+
+def _json_default(value: Any) -> str:
+    # scalars whose text form is stable; anything else (a repr with a memory address) is not
+    if isinstance(value, (datetime, date, pd.Timestamp, np.generic)):
+        return str(value)
+    raise TypeError(f"no stable fingerprint for {type(value).__name__}")
+
+
+def fingerprint(value: Any) -> Optional[str]:
+    # content digest of a task input: data frames by their values, columns and dtypes, plain
+    # data (dicts, lists, strings, numbers, timestamps) through JSON; None when the value has no
+    # stable digest, which turns caching off for that call
+    if isinstance(value, pd.DataFrame):
+        try:
+            values = pd.util.hash_pandas_object(value, index=True).to_numpy()
+        except TypeError:
+            # list-valued cells (classifier output) cannot be hashed as they are
+            values = pd.util.hash_pandas_object(value.astype(str), index=True).to_numpy()
+        digest = hashlib.md5(values.tobytes())
+        digest.update(json.dumps([list(map(str, value.columns)), list(map(str, value.dtypes))]).encode("utf-8"))
+        return digest.hexdigest()
+    try:
+        return hashlib.md5(json.dumps(value, sort_keys=True, ensure_ascii=False, default=_json_default).encode("utf-8")).hexdigest()
+    except (TypeError, ValueError):
+        return hash_objects(value)
+
+
+@dataclass
+class Fingerprint(CachePolicy):
+    # Cache key built from the content of every input, so the same tweets give the same key in
+    # any flow run. Prefect's default policy also keys on the run id, so nothing it caches is
+    # reused by a later run; data frames are hashed by their values instead of serialized whole.
+    #
+    # The task's source is part of the key so that editing a task body invalidates its cached
+    # results, and version covers what the body depends on but does not contain (the prompt and
+    # model behind a classification). The key is computed here rather than compounded with
+    # TASK_SOURCE: a compound policy leaves out the parts that return None, so one input without
+    # a fingerprint would leave a key made of the source alone, shared by every call.
+    version: str = ""
+
+    def compute_key(
+        self,
+        task_ctx: TaskRunContext,
+        inputs: dict[str, Any],
+        flow_parameters: dict[str, Any],
+        **kwargs: Any,
+    ) -> Optional[str]:
+        source = TASK_SOURCE.compute_key(task_ctx, inputs, flow_parameters, **kwargs)
+        if source is None:
+            return None
+        digests = {"__source__": source, "__version__": self.version}
+        for name, value in sorted(inputs.items()):
+            digest = fingerprint(value)
+            if digest is None:
+                return None
+            digests[name] = digest
+        return hashlib.md5(json.dumps(digests, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# A task's result_storage has to be a storage block saved on the server, so cached results go to
+# Prefect's default local result storage instead, pointed at TASK_RESULTS: deployments pass
+# RESULT_ENV to their runs, scripts run their flow inside result_settings(). The setting is read
+# when a flow starts, so setting os.environ from a module that Prefect has already loaded is too late.
+RESULT_ENV = {"PREFECT_LOCAL_STORAGE_PATH": str(TASK_RESULTS)}
+
+
+def result_settings():
+    return temporary_settings(updates={PREFECT_LOCAL_STORAGE_PATH: TASK_RESULTS})
+
+
+def cached(expiration: timedelta, version: str = "") -> dict:
+    # @task options for a task whose result depends only on its inputs (and on version): results
+    # are persisted and reused by any run that calls the task with the same content before
+    # expiration. A task that raises is never cached.
+    return {
+        "cache_policy": Fingerprint(version=version),
+        "cache_expiration": expiration,
+        "persist_result": True,
+    }
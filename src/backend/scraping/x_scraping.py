@@ -1,5 +1,6 @@
 import urllib.parse
 import asyncio
+import re
 from playwright.async_api import async_playwright
 import time
 from datetime import datetime
@@ -55,6 +56,12 @@ class XScraping:
             await page.screenshot(path="tmp/debug_screenshot_no_tweets.png")
             return False
 
+    @staticmethod
+    def tweet_id_from_link(tweet_link: str) -> int | None:
+        # links look like /<user>/status/<id>; the id is a 64-bit snowflake
+        match = re.search(r"/status/(\d+)", tweet_link or "")
+        return int(match.group(1)) if match else None
+
     async def extract_articles(self, category: str, tag: str, count_tweets: int, articles: list, seen_pairs: set, all_tweet_entries: list) -> None:
         for i, article in enumerate(articles):
             displayName = await article.query_selector("[data-testid='User-Name']")
@@ -67,6 +74,10 @@ class XScraping:
                 continue
             link_element = link_elements[2]
             tweet_link = await link_element.get_attribute("href")
+            tweet_id = self.tweet_id_from_link(tweet_link)
+            if tweet_id is None:
+                logger.debug(f"No status id in tweet link: {tweet_link}")
+                continue
             if displayName:
                 spans = await displayName.query_selector_all("span")
                 time_tag = await displayName.query_selector("time")
@@ -86,10 +97,10 @@ class XScraping:
                         try:
                             dt_naive = datetime.strptime(dateTime, "%Y-%m-%dT%H:%M:%S.%fZ")
                             now = datetime.now()
-                            key = (userName, tweetText)
-                            if key not in seen_pairs:
-                                seen_pairs.add(key)
+                            if tweet_id not in seen_pairs:
+                                seen_pairs.add(tweet_id)
                                 all_tweet_entries.append({
+                                    "tweet_id": tweet_id,
                                     "category": category,
                                     "tag": tag,
                                     "username": userName,
@@ -172,6 +183,7 @@ class XScraping:
         all_tweet['tweetText'] = all_tweet['tweetText'].astype('string')
         all_tweet['tag'] = all_tweet['tag'].astype('string')
         all_tweet['tweet_link'] = all_tweet['tweet_link'].astype('string')
+        all_tweet['tweet_id'] = all_tweet['tweet_id'].astype('int64')
 
         all_tweet['year'] = all_tweet['postTimeRaw'].dt.year
         all_tweet['month'] = all_tweet['postTimeRaw'].dt.month
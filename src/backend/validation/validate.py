@@ -10,6 +10,7 @@ from config.logging.modern_log import LoggingConfig
 logger = LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
 
 class TweetData(BaseModel):
+    tweet_id: int
     username: str
     tweetText: str
     scrapeTime: datetime
@@ -19,6 +20,12 @@ class TweetData(BaseModel):
     month: int
     day: int
 
+    @field_validator('tweet_id')
+    def validate_tweet_id(cls, v):
+        if not 0 < v < 2**63:
+            raise ValueError("tweet_id must be a positive int64")
+        return v
+
     @field_validator('postTimeRaw')
     def validate_post_time(cls, v):
         if v.year < 2020 or v > datetime.now():
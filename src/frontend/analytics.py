@@ -0,0 +1,101 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import urlparse
+
+import duckdb
+import pandas as pd
+
+# Import config_streamlit
+from config_streamlit import ANALYTICS_THREADS, ANALYTICS_MAX_RESULTS
+
+# In-process analytical engine for the dashboard: DuckDB scans the lakeFS Parquet through its
+# S3 gateway with hive partition pruning and multi-threaded vectorized aggregation, and hands
+# the page a finished table. Results are cached per (query, parameters, snapshot), where the
+# snapshot is a hash of the dataset's file names; the loaders only add files or rewrite the
+# table under new names, so any change to the data changes the snapshot.
+
+INTERVAL_MINUTES = {"min": 1, "H": 60, "D": 24 * 60}
+
+
+def interval_minutes(freq: str) -> int:
+    # "15min", "1H", "3D" -> minutes, the grouping options offered by the form
+    match = re.fullmatch(r"(\d+)(min|H|D)", freq)
+    if not match:
+        raise ValueError(f"Unsupported grouping interval: {freq}")
+    return int(match.group(1)) * INTERVAL_MINUTES[match.group(2)]
+
+
+class AnalyticsEngine:
+    def __init__(self, lakefs_endpoint: str = "http://lakefsdb:8000/", threads: int = ANALYTICS_THREADS, max_results: int = ANALYTICS_MAX_RESULTS):
+        self.max_results = max_results
+        self.results: OrderedDict[tuple, pd.DataFrame] = OrderedDict()
+        self._lock = threading.Lock()
+        self.con = duckdb.connect()
+        self.con.execute(f"SET threads = {int(threads)}")
+        # httpfs is installed when the image is built (Dockerfile.streamlit), so starting a
+        # session never downloads anything
+        self.con.execute("LOAD httpfs")
+        endpoint = urlparse(lakefs_endpoint)
+        self.con.execute("SET s3_endpoint = ?", [endpoint.netloc])
+        self.con.execute("SET s3_use_ssl = ?", [endpoint.scheme == "https"])
+        self.con.execute("SET s3_url_style = 'path'")
+        self.con.execute("SET s3_access_key_id = ?", [os.getenv("ACCESS_KEY", "")])
+        self.con.execute("SET s3_secret_access_key = ?", [os.getenv("SECRET_KEY", "")])
+
+    def query(self, sql: str, params: list, snapshot: str) -> pd.DataFrame:
+        key = (sql, repr(params), snapshot)
+        with self._lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+        # a cursor is a separate connection to the same database, safe to use from this session's thread
+        with self.con.cursor() as cursor:
+            result = cursor.execute(sql, params).df()
+        with self._lock:
+            self.results[key] = result
+            while len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+        return result
+
+    @staticmethod
+    def parquet_glob(lakefs_s3_path: str) -> str:
+        return lakefs_s3_path.rstrip("/") + "/*/*/*/*.parquet"
+
+    def parquet_source(self, lakefs_s3_path: str) -> str:
+        path = self.parquet_glob(lakefs_s3_path).replace("'", "''")
+        return f"read_parquet('{path}', hive_partitioning = true, union_by_name = true)"
+
+    def snapshot(self, lakefs_s3_path: str) -> str:
+        with self.con.cursor() as cursor:
+            files = cursor.execute("SELECT file FROM glob(?) ORDER BY file", [self.parquet_glob(lakefs_s3_path)]).fetchall()
+        return hashlib.sha1(repr(files).encode("utf-8")).hexdigest()
+
+    def tag_counts(self, lakefs_s3_path_tag_counts: str, tags: list[str], start: datetime, end: datetime, freq: str) -> pd.DataFrame:
+        # The rollup holds tweets per tag and 15-minute bucket; a coarser interval is the sum of the
+        # 15-minute buckets inside it, re-bucketed from the start day's midnight. Buckets are
+        # matched on their start, like the word-cloud counts.
+        minutes = interval_minutes(freq)
+        origin = datetime.combine(start.date(), datetime.min.time())
+        sql = f"""
+            SELECT
+                time_bucket(to_minutes(CAST(? AS BIGINT)), CAST(bucket AS TIMESTAMP), CAST(? AS TIMESTAMP)) AS postTimeRaw,
+                tag,
+                sum(count) AS count
+            FROM {self.parquet_source(lakefs_s3_path_tag_counts)}
+            WHERE make_date(CAST(year AS INTEGER), CAST(month AS INTEGER), CAST(day AS INTEGER)) BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)
+              AND list_contains(CAST(? AS VARCHAR[]), tag)
+              AND CAST(bucket AS TIMESTAMP) BETWEEN CAST(? AS TIMESTAMP) AND CAST(? AS TIMESTAMP)
+            GROUP BY ALL
+            ORDER BY postTimeRaw
+        """
+        params = [minutes, origin, start.date(), end.date(), list(tags), pd.Timestamp(start).floor("15min").to_pydatetime(), end]
+        counts = self.query(sql, params, self.snapshot(lakefs_s3_path_tag_counts))
+        if counts.empty:
+            return pd.DataFrame()
+        wide = counts.pivot(index="postTimeRaw", columns="tag", values="count")
+        buckets = pd.date_range(wide.index.min(), wide.index.max(), freq=f"{minutes}min", name="postTimeRaw")
+        return wide.reindex(buckets).fillna(0)
@@ -1,6 +1,19 @@
+import os
 import random
 import colorsys
 
+# Memory budget for the Arrow tables shared by all dashboard sessions
+ARROW_CACHE_MAX_BYTES = int(os.getenv("ARROW_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# DuckDB worker threads and number of cached aggregate results
+ANALYTICS_THREADS = int(os.getenv("ANALYTICS_THREADS", str(os.cpu_count() or 4)))
+ANALYTICS_MAX_RESULTS = int(os.getenv("ANALYTICS_MAX_RESULTS", "256"))
+# Points kept per time series, about one per horizontal pixel of the chart
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "1000"))
+# Rows per page of the tweet table
+TABLE_PAGE_SIZE = int(os.getenv("TABLE_PAGE_SIZE", "50"))
+# Tweet cards shown per "load more" step of the word-cloud drill-down
+GALLERY_PAGE_SIZE = int(os.getenv("GALLERY_PAGE_SIZE", "30"))
+
 def random_color():
     h = random.random()                        
     s = 0.8 + random.random() * 0.2             
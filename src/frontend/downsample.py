@@ -0,0 +1,30 @@
+import numpy as np
+
+# Largest-Triangle-Three-Buckets: keeps the points that preserve the visual shape of a line
+# when it is drawn with fewer points than it has. The chart is stacked and every tag shares
+# one time axis, so the points are chosen once on the stack total and every series keeps the
+# same rows.
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    # first and last points are always kept, the rest is split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # average of the next bucket is the third corner of the triangle
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
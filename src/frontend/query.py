@@ -0,0 +1,350 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, NamedTuple, Optional
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+# Query layer for the dashboard: form selections become pyarrow dataset filters, so only the
+# year/month/day partitions inside the selected window are listed and opened, and only the
+# requested columns of the matching row groups are decoded.
+
+def storage_options(lakefs_endpoint: str) -> dict:
+    return {
+        "key": os.getenv("ACCESS_KEY"),
+        "secret": os.getenv("SECRET_KEY"),
+        "client_kwargs": {
+            "endpoint_url": lakefs_endpoint
+        }
+    }
+
+def read_catalog(lakefs_s3_path_catalog: str, lakefs_endpoint: str) -> Optional[dict]:
+    # manifest the loader rewrites on every load; None until the first load that writes one
+    fs = fsspec.filesystem("s3", **storage_options(lakefs_endpoint))
+    if not fs.exists(lakefs_s3_path_catalog):
+        return None
+    with fs.open(lakefs_s3_path_catalog, "r") as f:
+        return json.load(f)
+
+def open_dataset(lakefs_s3_path: str, lakefs_endpoint: str) -> ds.Dataset:
+    fs = fsspec.filesystem("s3", **storage_options(lakefs_endpoint))
+    return ds.dataset(
+        lakefs_s3_path.removeprefix("s3://"),
+        filesystem=fs,
+        format="parquet",
+        partitioning="hive",
+    )
+
+def partition_filter(start: datetime, end: datetime) -> ds.Expression:
+    # one condition per month in the window; the first and last month are trimmed by day
+    expression = None
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        condition = (ds.field("year") == year) & (ds.field("month") == month)
+        if (year, month) == (start.year, start.month):
+            condition = condition & (ds.field("day") >= start.day)
+        if (year, month) == (end.year, end.month):
+            condition = condition & (ds.field("day") <= end.day)
+        expression = condition if expression is None else expression | condition
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return expression
+
+def build_filter(tags: list[str], start: datetime, end: datetime, time_column: str = "postTimeRaw") -> ds.Expression:
+    return (
+        partition_filter(start, end)
+        & ds.field("tag").isin(list(tags))
+        & (ds.field(time_column) >= start)
+        & (ds.field(time_column) <= end)
+    )
+
+def read(
+    lakefs_s3_path: str,
+    tags: list[str],
+    start: datetime,
+    end: datetime,
+    columns: Optional[list[str]] = None,
+    time_column: str = "postTimeRaw",
+    extra_filter: Optional[ds.Expression] = None,
+    lakefs_endpoint: str = "http://lakefsdb:8000/",
+) -> pd.DataFrame:
+    expression = build_filter(tags, start, end, time_column)
+    if extra_filter is not None:
+        expression = expression & extra_filter
+    table = open_dataset(lakefs_s3_path, lakefs_endpoint).to_table(columns=columns, filter=expression)
+    return table.to_pandas()
+
+
+class Snapshot(NamedTuple):
+    # swapped in as one object so readers never pair a new table with an old index
+    table: Optional[pa.Table] = None
+    times: Optional[np.ndarray] = None
+    index: dict = {}
+
+
+class LiveDataset:
+    # Keeps the projected columns of a lakeFS Parquet dataset in memory and brings it up to
+    # date by reading only the files that appeared since the last refresh. The loaders only
+    # ever add files, so a file that disappeared or changed means the dataset was rewritten
+    # (compaction, overwrite) and the whole thing is read again.
+    #
+    # The table is kept sorted by time_column, so a time window is a zero-copy slice found by
+    # binary search; only the tag filter inside the window materializes new buffers.
+    #
+    # index_columns are list<string> label columns (topic, subtopic) indexed at load time as
+    # label -> ascending row ids, so finding the rows carrying a label is a dict lookup.
+    #
+    # search_columns are the string columns page() matches a search term against.
+    def __init__(
+        self,
+        lakefs_s3_path: str,
+        columns: list[str],
+        time_column: str = "postTimeRaw",
+        index_columns: tuple[str, ...] = (),
+        search_columns: tuple[str, ...] = (),
+        lakefs_endpoint: str = "http://lakefsdb:8000/",
+    ):
+        self.base = lakefs_s3_path.removeprefix("s3://").rstrip("/")
+        self.columns = columns
+        self.time_column = time_column
+        self.index_columns = index_columns
+        self.search_columns = search_columns
+        self.fs = fsspec.filesystem("s3", **storage_options(lakefs_endpoint))
+        self.files: dict[str, tuple] = {}
+        self.snapshot = Snapshot()
+        self.full_loads = 0
+        self.delta_loads = 0
+        self._lock = threading.Lock()
+
+    @property
+    def table(self) -> Optional[pa.Table]:
+        return self.snapshot.table
+
+    @property
+    def nbytes(self) -> int:
+        table, times, _ = self.snapshot
+        return (table.nbytes if table is not None else 0) + (times.nbytes if times is not None else 0)
+
+    @staticmethod
+    def signature(info: dict) -> tuple:
+        return (info.get("size"), info.get("ETag") or info.get("LastModified") or info.get("mtime"))
+
+    def list_files(self) -> dict[str, tuple]:
+        # s3fs caches listings, drop them or new files stay invisible
+        self.fs.invalidate_cache(self.base)
+        listing = self.fs.find(self.base, detail=True)
+        return {
+            path: self.signature(info)
+            for path, info in listing.items()
+            if info.get("type") != "directory" and not os.path.basename(path).startswith(("_", "."))
+        }
+
+    def read_files(self, paths: list[str]) -> pa.Table:
+        dataset = ds.dataset(
+            sorted(paths),
+            filesystem=self.fs,
+            format="parquet",
+            partitioning=ds.HivePartitioning.discover(),
+            partition_base_dir=self.base,
+        )
+        # files written before a column was added lack it; unify so those rows read as null
+        schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.get_fragments()], promote_options="permissive")
+        dataset = ds.dataset(sorted(paths), schema=schema, filesystem=self.fs, format="parquet")
+        table = dataset.to_table(columns=[column for column in self.columns if column in schema.names])
+        for column in self.columns:
+            if column not in table.column_names:
+                table = table.append_column(column, pa.nulls(len(table), pa.string()))
+        table = table.select(self.columns)
+        return table.filter(pc.is_valid(table[self.time_column]))
+
+    def set_table(self, table: Optional[pa.Table]) -> None:
+        if table is None:
+            self.snapshot = Snapshot()
+            return
+        table = table.sort_by(self.time_column).combine_chunks()
+        times = table[self.time_column].to_numpy().astype("datetime64[ns]")
+        index = {column: self.build_index(table[column]) for column in self.index_columns}
+        self.snapshot = Snapshot(table, times, index)
+
+    @staticmethod
+    def build_index(labels: pa.ChunkedArray) -> dict[str, np.ndarray]:
+        labels = labels.combine_chunks()
+        flat = pc.list_flatten(labels)
+        parents = pc.list_parent_indices(labels).to_numpy()
+        valid = pc.is_valid(flat).to_numpy(zero_copy_only=False)
+        encoded = pc.dictionary_encode(flat.filter(pc.is_valid(flat)))
+        codes = encoded.indices.to_numpy()
+        parents = parents[valid]
+        order = np.argsort(codes, kind="stable")
+        codes, parents = codes[order], parents[order]
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])
+        dictionary = encoded.dictionary.to_pylist()
+        return {
+            dictionary[codes[start]]: np.unique(rows)
+            for start, rows in zip(starts, np.split(parents, starts[1:]))
+            if len(rows)
+        }
+
+    def _refresh(self) -> None:
+        listing = self.list_files()
+        rewritten = any(listing.get(path) != signature for path, signature in self.files.items())
+        if self.table is None or rewritten:
+            self.set_table(self.read_files(list(listing)) if listing else None)
+            self.full_loads += 1
+        else:
+            new_paths = [path for path in listing if path not in self.files]
+            if new_paths:
+                # new files can drift in type (timestamp unit, a column that was all null); they
+                # are unified the way a full load unifies its files
+                self.set_table(pa.concat_tables([self.table, self.read_files(new_paths)], promote_options="permissive"))
+                self.delta_loads += 1
+        self.files = listing
+
+    def refresh(self) -> pa.Table:
+        with self._lock:
+            self._refresh()
+            return self.table
+
+    def load(self) -> Optional[pa.Table]:
+        # first use: the sessions that ask at the same time wait for one read instead of each
+        # reading the same files
+        with self._lock:
+            if self.table is None:
+                self._refresh()
+            return self.table
+
+    @staticmethod
+    def bounds(times: np.ndarray, start: datetime, end: datetime) -> tuple[int, int]:
+        lo = np.searchsorted(times, np.datetime64(start, "ns"), side="left")
+        hi = np.searchsorted(times, np.datetime64(end, "ns"), side="right")
+        return int(lo), int(hi)
+
+    def window(self, tags: list[str], start: datetime, end: datetime) -> Optional[pa.Table]:
+        table, times, _ = self.snapshot
+        if table is None:
+            return None
+        lo, hi = self.bounds(times, start, end)
+        view = table.slice(lo, hi - lo)
+        return view.filter(ds.field("tag").isin(list(tags)))
+
+    def lookup(self, column: str, label: str, tags: list[str], start: datetime, end: datetime) -> pd.DataFrame:
+        # rows carrying label inside the window: index lookup, then a take of those rows only
+        table, times, index = self.snapshot
+        rows = index.get(column, {}).get(label)
+        if table is None or rows is None:
+            return pd.DataFrame(columns=self.columns)
+        lo, hi = self.bounds(times, start, end)
+        rows = rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)]
+        view = table.take(rows)
+        return view.filter(ds.field("tag").isin(list(tags))).to_pandas()
+
+    def matching_rows(self, view: pa.Table, tags: list[str], search: str = "") -> pa.Array:
+        # positions in view of the rows to show; a mask per condition, no column is copied
+        mask = pc.is_in(view["tag"], value_set=pa.array(list(tags), pa.string()))
+        # a dataset with nothing to search in ignores the search term
+        if search and self.search_columns:
+            found = None
+            for column in self.search_columns:
+                hit = pc.fill_null(pc.match_substring(view[column], search, ignore_case=True), False)
+                found = hit if found is None else pc.or_(found, hit)
+            mask = pc.and_(mask, found)
+        return pc.indices_nonzero(mask)
+
+    def count(self, tags: list[str], start: datetime, end: datetime, search: str = "") -> int:
+        table, times, _ = self.snapshot
+        if table is None:
+            return 0
+        lo, hi = self.bounds(times, start, end)
+        return len(self.matching_rows(table.slice(lo, hi - lo), tags, search))
+
+    def page(
+        self,
+        tags: list[str],
+        start: datetime,
+        end: datetime,
+        page: int = 0,
+        page_size: int = 50,
+        sort_by: Optional[str] = None,
+        descending: bool = True,
+        search: str = "",
+    ) -> tuple[pd.DataFrame, int]:
+        # One page of the window and the number of matching rows. Sorting orders row positions by
+        # the sort column alone; only the rows on the page are taken and converted.
+        table, times, _ = self.snapshot
+        if table is None:
+            return pd.DataFrame(columns=self.columns), 0
+        lo, hi = self.bounds(times, start, end)
+        view = table.slice(lo, hi - lo)
+        rows = self.matching_rows(view, tags, search)
+        total = len(rows)
+        sort_by = sort_by or self.time_column
+        if sort_by != self.time_column or descending:
+            order = pc.sort_indices(
+                pa.table({"key": view[sort_by].take(rows)}),
+                sort_keys=[("key", "descending" if descending else "ascending")],
+            )
+            rows = rows.take(order)
+        rows = rows[page * page_size:(page + 1) * page_size]
+        return view.take(rows).to_pandas(), total
+
+    def query(self, tags: list[str], start: datetime, end: datetime) -> pd.DataFrame:
+        view = self.window(tags, start, end)
+        if view is None:
+            return pd.DataFrame(columns=self.columns)
+        return view.to_pandas()
+
+
+class ArrowCache:
+    # Process-wide home of the LiveDatasets: one resident table per dataset, shared by every
+    # session. When the tables together exceed max_bytes the least recently used ones are
+    # evicted by taking them out of the cache, never by emptying them: a session that is
+    # rendering from an evicted dataset keeps its snapshot, the memory is freed once the last
+    # session lets go, and the next use builds a fresh dataset.
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.datasets: OrderedDict[str, LiveDataset] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(dataset.nbytes for dataset in list(self.datasets.values()))
+
+    def get(self, name: str, factory: Callable[[], LiveDataset]) -> LiveDataset:
+        with self._lock:
+            if name not in self.datasets:
+                self.datasets[name] = factory()
+            self.datasets.move_to_end(name)
+            dataset = self.datasets[name]
+        if dataset.table is None:
+            # the dataset's own lock, so loading one dataset does not hold up the others
+            dataset.load()
+            self.evict(keep=name)
+        return dataset
+
+    def refresh(self, name: str) -> None:
+        with self._lock:
+            dataset = self.datasets.get(name)
+        if dataset is not None:
+            dataset.refresh()
+            self.evict(keep=name)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        with self._lock:
+            for name in list(self.datasets):
+                if self.nbytes <= self.max_bytes:
+                    break
+                if name != keep:
+                    del self.datasets[name]
+
+    def stats(self) -> dict:
+        return {
+            "max_bytes": self.max_bytes,
+            "nbytes": self.nbytes,
+            "datasets": {name: dataset.nbytes for name, dataset in self.datasets.items()},
+        }
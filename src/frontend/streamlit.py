@@ -4,14 +4,38 @@ import pandas as pd
 from datetime import datetime, time, timedelta
 from streamlit_echarts import st_echarts
 import altair as alt
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import numpy as np
+import json
+import html
+from time import perf_counter
 
 # Import config_streamlit 
-from config_streamlit import random_color
+from config_streamlit import random_color, ARROW_CACHE_MAX_BYTES, CHART_MAX_POINTS, TABLE_PAGE_SIZE, GALLERY_PAGE_SIZE
+# Import query layer
+import query
+# Import analytical query engine
+from analytics import AnalyticsEngine
+# Import chart downsampling
+from downsample import lttb_indices
 # Import path configuration
-from config.path_config import lakefs_s3_path, lakefs_s3_path_ml
+from config.path_config import lakefs_s3_path, lakefs_s3_path_ml, lakefs_s3_path_ml_counts, lakefs_s3_path_tag_counts, lakefs_s3_path_catalog
+# Import modern logging configuration
+from config.logging.modern_log import LoggingConfig
+
+
+@st.cache_resource
+def get_logger():
+    # streamlit re-runs this script on every interaction; the handlers are set up once per process
+    return LoggingConfig(level="DEBUG", level_console="INFO").get_logger()
+
 
 st.set_page_config(layout="wide")
 
+logger = get_logger()
+
 
 st.markdown("""
 <style>
@@ -36,48 +60,77 @@ st.markdown("""
 
 if 'submitted' not in st.session_state:
     st.session_state.submitted = False
-if "refresh_key" not in st.session_state:
-    st.session_state.refresh_key = 0
 
 status_topic_ml = False
 status_subtopic_ml = False
 
+@st.cache_resource
+def arrow_cache() -> query.ArrowCache:
+    # one resident copy of each dataset for the whole process; sessions get slices of it
+    return query.ArrowCache(ARROW_CACHE_MAX_BYTES)
+
+def live_tweets(lakefs_endpoint: str = "http://lakefsdb:8000/") -> query.LiveDataset:
+    return arrow_cache().get("tweets", lambda: query.LiveDataset(
+        lakefs_s3_path,
+        columns=['postTimeRaw', 'category', 'tag', 'username', 'tweetText', 'tweet_link'],
+        search_columns=('tweetText', 'username'),
+        lakefs_endpoint=lakefs_endpoint,
+    ))
+
+def live_wordcloud(lakefs_endpoint: str = "http://lakefsdb:8000/") -> query.LiveDataset:
+    return arrow_cache().get("wordcloud", lambda: query.LiveDataset(
+        lakefs_s3_path_ml,
+        columns=['tweetText', 'tag', 'postTimeRaw', 'username', 'tweet_link', 'topic', 'subtopic'],
+        index_columns=('topic', 'subtopic'),
+        lakefs_endpoint=lakefs_endpoint,
+    ))
+
+@st.cache_resource
+def analytics_engine(lakefs_endpoint: str = "http://lakefsdb:8000/") -> AnalyticsEngine:
+    # one DuckDB database per process, each query runs on its own cursor
+    return AnalyticsEngine(lakefs_endpoint)
+
+@st.cache_data(ttl=60)
+def dataset_catalog(lakefs_endpoint: str = "http://lakefsdb:8000/") -> dict:
+    # tags and time range for the form come from the loader's manifest, not from the data
+    catalog = query.read_catalog(lakefs_s3_path_catalog, lakefs_endpoint)
+    if catalog is not None:
+        return catalog
+    table = live_tweets(lakefs_endpoint).table
+    if table is None or table.num_rows == 0:
+        # nothing loaded yet: an empty catalog, the page says so instead of drawing the form
+        return {"min_time": None, "max_time": None, "tags": []}
+    post_time_range = pc.min_max(table['postTimeRaw'])
+    return {
+        "min_time": post_time_range['min'].as_py().isoformat(),
+        "max_time": post_time_range['max'].as_py().isoformat(),
+        "tags": pc.unique(table['tag']).to_pylist(),
+    }
+
 def event_handler():
+    dataset_catalog.clear()
     st.session_state.submitted = True
-    st.session_state.refresh_key += 1
+    # new files only; datasets that were evicted reload on their next use
+    arrow_cache().refresh("tweets")
+    arrow_cache().refresh("wordcloud")
 
 @st.cache_data
 def load_css(file_name):
     with open(file_name) as f:
         st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
-def wordcloud_generate(df: pd.DataFrame):
-    def generate_options(df: pd.DataFrame) -> list[dict]:
-        def remove_stopwords(word_list, stopwords):
-            return [word for word in word_list if word not in stopwords]
-        stop_word = list(
-            set(
-                word
-                for tags in df['tag'].dropna()
-                for word in tags.split("#")
-                if word.strip() 
-            )
-        )
-        all_filtered_df_wordcloud = filtered_df_wordcloud['subtopic'].explode().values.tolist()
-        filtered_faq_all = remove_stopwords(all_filtered_df_wordcloud, stop_word)
-        result = [
-            {
-                "name": topic, 
-                "value": filtered_faq_all.count(topic),
-                "textStyle": {
-                    "color": random_color() 
-                }
+def wordcloud_generate(counts: pd.DataFrame):
+    # counts is already label -> count with the hashtag stop-words removed by the pipeline
+    all_result = [
+        {
+            "name": label,
+            "value": int(count),
+            "textStyle": {
+                "color": random_color()
             }
-            for topic in set(filtered_faq_all)
-        ]
-        return result
-        
-    all_result = generate_options(filtered_df_wordcloud)
+        }
+        for label, count in zip(counts['label'], counts['count'])
+    ]
 
     options_all = {
         "title": {
@@ -133,15 +186,8 @@ def wordcloud_generate(df: pd.DataFrame):
 
     return event_word_cloud_all
 
-def barchart_generate(df: pd.DataFrame):
-    all_faq_subtopics_list = df['subtopic'].explode().values.tolist()
-
-    all_faq_subtopics_count =pd.DataFrame(all_faq_subtopics_list)\
-                .value_counts().to_frame()\
-                .sort_values(by='count', ascending=False)\
-                .reset_index()\
-                [:10]
-    all_faq_subtopics_count.columns = ['subtopic', 'count']
+def barchart_generate(counts: pd.DataFrame):
+    all_faq_subtopics_count = counts.nlargest(10, 'count').rename(columns={'label': 'subtopic'})
     chart = alt.Chart(all_faq_subtopics_count).mark_bar().encode(
         x=alt.X('count', title='Count'),
         y=alt.Y('subtopic', sort='-x', title='Topic'),
@@ -154,59 +200,35 @@ def barchart_generate(df: pd.DataFrame):
     st.altair_chart(chart)
 
 @st.cache_data(ttl=600)
-def data_from_lakefs(refresh_key: int = None, lakefs_endpoint: str = "http://lakefsdb:8000/", columns: list[str] = None):
-    storage_options = {
-        "key": os.getenv("ACCESS_KEY"),
-        "secret": os.getenv("SECRET_KEY"),
-        "client_kwargs": {
-            "endpoint_url": lakefs_endpoint
-        }
-    }
-    df = pd.read_parquet(
-        lakefs_s3_path,
-        columns=columns,
-        storage_options=storage_options,
-        engine='pyarrow',
+def label_counts_from_lakefs(tags: tuple[str], start_datetime: datetime, end_datetime: datetime, level: str = "subtopic", lakefs_endpoint: str = "http://lakefsdb:8000/") -> pd.DataFrame:
+    # buckets are 15 minutes wide, so the range is matched on bucket start
+    df = query.read(
+        lakefs_s3_path_ml_counts,
+        tags,
+        pd.Timestamp(start_datetime).floor('15min').to_pydatetime(),
+        end_datetime,
+        columns=['label', 'count'],
+        time_column='bucket',
+        extra_filter=ds.field('level') == level,
+        lakefs_endpoint=lakefs_endpoint,
     )
-    return df
-
-@st.cache_data(ttl=600)
-def wordcloud_from_lakefs(lakefs_endpoint: str = "http://lakefsdb:8000/", columns: list[str] = None):
-    storage_options = {
-        "key": os.getenv("ACCESS_KEY"),
-        "secret": os.getenv("SECRET_KEY"),
-        "client_kwargs": {
-            "endpoint_url": lakefs_endpoint
-        }
-    }
-    df = pd.read_parquet(
-        lakefs_s3_path_ml,
-        columns=columns,
-        storage_options=storage_options,
-        engine='pyarrow',
-    )
-    return df
-
-def convert_df_to_echart_option(df: pd.DataFrame):
-    df = df.reset_index()
-    df_sorted = df.sort_values('postTimeRaw')
-    x_data = df_sorted['postTimeRaw'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist()
-    
-    series = []
-    for col in df.columns:
-        if col == 'postTimeRaw':
-            continue
-        series.append({
-            'name': col,
-            'type': 'line',
-            'stack': 'Total',
-            'data': df_sorted[col].tolist()
-        })
+    return df.groupby('label', as_index=False)['count'].sum().sort_values('count', ascending=False)
+
+def convert_df_to_echart_option(df: pd.DataFrame, max_points: int = CHART_MAX_POINTS):
+    # one shared dataset with epoch-millisecond timestamps instead of a formatted label list
+    # per axis and a data list per series; rows are thinned to about one per pixel first
+    started = perf_counter()
+    df = df.sort_index()
+    tags = [str(col) for col in df.columns]
+    x = df.index.values.astype("datetime64[ms]").astype("int64")
+    rows = lttb_indices(x, df.sum(axis=1).to_numpy(), max_points)
+    source = np.column_stack([x[rows], df.to_numpy()[rows].astype("int64")]).tolist()
 
     option = {
         # 'title': {'text': 'Stacked Line'},
+        'useUTC': True, # timestamps are the stored local times, show them unshifted
         'tooltip': {'trigger': 'axis'},
-        'legend': {'data': [col for col in df.columns if col != 'postTimeRaw']},
+        'legend': {'data': tags},
         'grid': {
             'left': '3%',
             'right': '4%',
@@ -216,24 +238,113 @@ def convert_df_to_echart_option(df: pd.DataFrame):
         'toolbox': {
             'feature': {'saveAsImage': {}}
         },
+        'dataset': {
+            'dimensions': ['postTimeRaw'] + tags,
+            'source': source
+        },
         'xAxis': {
-            'type': 'category',
-            'boundaryGap': False,
-            'data': x_data
+            'type': 'time',
+            'boundaryGap': False
         },
         'yAxis': {'type': 'value'},
-        'series': series
+        'series': [
+            {
+                'name': tag,
+                'type': 'line',
+                'stack': 'Total',
+                'showSymbol': False,
+                'encode': {'x': 'postTimeRaw', 'y': tag}
+            }
+            for tag in tags
+        ]
     }
 
+    logger.info(
+        f"Time series option: {len(df)} -> {len(rows)} points x {len(tags)} tags, "
+        f"{len(json.dumps(option))} bytes, built in {(perf_counter() - started) * 1000:.1f} ms"
+    )
     return option
 
+def tweet_table(tweets: query.LiveDataset, tags: list[str], start_datetime: datetime, end_datetime: datetime) -> None:
+    # sorting, searching and paging run on the server; only the visible page goes to the browser
+    columns = {
+        "postTimeRaw": "Post Time",
+        "category": "Category",
+        "tag": "Hashtag",
+        "username": "Username",
+        "tweetText": "Tweet",
+    }
+    t1, t2, t3 = st.columns((4, 2, 1))
+    with t1:
+        search = st.text_input("ค้นหา (ข้อความ / username):", key="table_search").strip()
+    with t2:
+        sort_by = st.selectbox("เรียงตาม", list(columns), format_func=columns.get, key="table_sort")
+    with t3:
+        descending = st.toggle("มาก → น้อย", value=True, key="table_descending")
+
+    total = tweets.count(tags, start_datetime, end_datetime, search)
+    pages = max((total - 1) // TABLE_PAGE_SIZE + 1, 1)
+    # the widget reads its value from session state only, so setting the key here never
+    # conflicts with a default value
+    if "table_page" not in st.session_state:
+        st.session_state.table_page = 1
+    elif st.session_state.table_page > pages:
+        # a narrower search or range has fewer pages than the one being viewed
+        st.session_state.table_page = pages
+    page = st.number_input("หน้า", min_value=1, max_value=pages, step=1, key="table_page") - 1
+    page_df, _ = tweets.page(tags, start_datetime, end_datetime, page, TABLE_PAGE_SIZE, sort_by, descending, search)
+    st.caption(f"{total:,} tweets · หน้า {page + 1} / {pages}")
+    st.dataframe(
+        page_df,
+        hide_index=True,
+        column_config={
+            **columns,
+            "tweet_link": st.column_config.LinkColumn(label="Link")
+        },
+    )
+
+def tweet_card(tweet) -> str:
+    # the card styles and the X logo live in styles/style.css, a card is markup only
+    postTimeRaw_text = html.escape(str(tweet.postTimeRaw).strip())
+    tweetText_text = html.escape(str(tweet.tweetText).strip()).replace('\n', '<br>')
+    tweet_link = html.escape(str(tweet.tweet_link).strip(), quote=True)
+    return (
+        '<div class="box">'
+        f'<div class="logo"><a href="{tweet_link}" class="xlink" style="color: black;">x.com</a></div>'
+        f'<div class="info"><p>{tweetText_text}</p></div>'
+        f'<div class="foot"><p>{postTimeRaw_text}</p></div>'
+        '</div>'
+    )
+
+def tweet_gallery(tweets_df: pd.DataFrame, nb_columns: int = 3) -> None:
+    # cards are dealt from the middle column outwards, and each column is one markdown call
+    mid = nb_columns // 2
+    order = []
+    for i in range(nb_columns):
+        if i % 2 == 0:
+            order.append(mid + i // 2)
+        else:
+            order.append(mid - (i + 1) // 2)
+    cards = [[] for _ in range(nb_columns)]
+    for index, tweet in enumerate(tweets_df.itertuples(index=False)):
+        cards[order[index % nb_columns]].append(tweet_card(tweet))
+    for col, col_cards in zip(st.columns(nb_columns), cards):
+        with col:
+            st.markdown(f'<div class="gallery">{"".join(col_cards)}</div>', unsafe_allow_html=True)
+
+def show_more_cards():
+    st.session_state.gallery_limit += GALLERY_PAGE_SIZE
+
 load_css("./src/frontend/styles/style.css")
 
 
-df_tag_time = data_from_lakefs(columns=['tag', 'postTimeRaw'])
-min_date = df_tag_time["postTimeRaw"].min().date()
-max_date = df_tag_time["postTimeRaw"].max().date()
-unique_tags = df_tag_time["tag"].unique().tolist()
+catalog = dataset_catalog()
+if not catalog['tags']:
+    st.info("ยังไม่มีข้อมูล กรุณารอให้ระบบดึงข้อมูลรอบแรกเสร็จก่อน")
+    st.stop()
+min_date = datetime.fromisoformat(catalog['min_time']).date()
+max_date = datetime.fromisoformat(catalog['max_time']).date()
+unique_tags = catalog['tags']
 
 with st.form("my_form"):
     selected_tags = st.multiselect("เลือก hashtag (tag):", unique_tags, default=unique_tags[0])
@@ -253,33 +364,15 @@ if st.session_state.submitted:
     # st.write(f"Start date: {start_date} - End date: {end_date}")
     # st.write(f"Start time: {start_time} - End time: {end_time}")
 
-    df = data_from_lakefs(refresh_key=st.session_state.refresh_key)
-
     start_datetime = datetime.combine(start_date, start_time)
     end_datetime = datetime.combine(end_date, end_time)
 
-    filtered_df = df[
-        (df["tag"].isin(selected_tags)) & 
-        (df["postTimeRaw"] >= start_datetime) & 
-        (df["postTimeRaw"] <= end_datetime)
-    ]
-    if len(filtered_df) != 0:
-        df_filtered = filtered_df.set_index("postTimeRaw")
-        df_grouped = df_filtered.groupby([pd.Grouper(freq=time_group), "tag"]).size().reset_index(name="count")
-
-        df_pivot = df_grouped.pivot(index="postTimeRaw", columns="tag", values="count").fillna(0)
-        dataframe_display = df_filtered.drop(columns=['index', 'year', 'month', 'day', 'scrapeTime'])
-        st.dataframe(
-            dataframe_display,
-            column_config={
-                "postTimeRaw": "Post Time",
-                "category": "Category",
-                "tag": "Hashtag",
-                "username": "Username",
-                "tweetText": "Tweet",
-                "tweet_link": st.column_config.LinkColumn(label="Link")
-            },
-        )
+    tweets = live_tweets()
+    total_tweets = tweets.count(selected_tags, start_datetime, end_datetime)
+    if total_tweets != 0:
+        # summed from the 15-minute tag rollup the loader maintains, cached until its files change
+        df_pivot = analytics_engine().tag_counts(lakefs_s3_path_tag_counts, selected_tags, start_datetime, end_datetime, time_group)
+        tweet_table(tweets, selected_tags, start_datetime, end_datetime)
 
         st.subheader("จำนวน Hashtag ต่อช่วงเวลา")
 
@@ -294,114 +387,47 @@ if st.session_state.submitted:
         #     st.subheader("จำนวน Hashtag ทั้งหมด")
         #     st.write(df_grouped)
 
-        df_wordcloud = wordcloud_from_lakefs()
-        # main
-        filtered_df_wordcloud = df_wordcloud[
-            (df_wordcloud["tag"].isin(selected_tags)) & 
-            (df_wordcloud["postTimeRaw"] >= start_datetime) & 
-            (df_wordcloud["postTimeRaw"] <= end_datetime)
-        ]  
+        subtopic_counts = label_counts_from_lakefs(tuple(selected_tags), start_datetime, end_datetime)
 
-        if len(filtered_df_wordcloud) > 0:
+        if len(subtopic_counts) > 0:
             # Barchart
-            barchart_generate(df=filtered_df_wordcloud)
+            barchart_generate(counts=subtopic_counts)
 
             st.write('')
             st.write('')
 
             # Word Cloud
-            event_word_cloud_all = wordcloud_generate(df=filtered_df_wordcloud)
+            event_word_cloud_all = wordcloud_generate(counts=subtopic_counts)
 
             if event_word_cloud_all:
 
                 st.subheader(f"ผลลัพธ์สำหรับ: {event_word_cloud_all}")
-                
-                filtered = filtered_df_wordcloud[
-                    filtered_df_wordcloud['subtopic'].apply(lambda x: event_word_cloud_all in x)
-                ]
-                filtered = filtered[['tweetText', 'tag', 'postTimeRaw']]
+
+                # subtopic -> row ids index, built when the classified tweets were loaded
+                filtered = live_wordcloud().lookup('subtopic', event_word_cloud_all, selected_tags, start_datetime, end_datetime)
                 if not filtered.empty:
                     # st.write(filtered)
-                    nb_columns = 3
-                    cols_info = st.columns(nb_columns)
-                    filtered = filtered.reset_index(drop=True)
-                    df_filtered_m = df_filtered.reset_index()[['tweetText', 'tag', 'postTimeRaw', 'tweet_link']]
-                    merged_df_tweet = pd.merge(
-                        filtered,
-                        df_filtered_m[['tweetText', 'tag', 'postTimeRaw', 'tweet_link']],
-                        on=['tweetText', 'tag', 'postTimeRaw'],
-                        how='left' 
-                    )
+                    # newest first, and only as many cards as have been asked for
+                    merged_df_tweet = filtered[['tweetText', 'tag', 'postTimeRaw', 'username', 'tweet_link']].sort_values('postTimeRaw', ascending=False).reset_index(drop=True)
+                    if st.session_state.get('gallery_label') != event_word_cloud_all:
+                        st.session_state.gallery_label = event_word_cloud_all
+                        st.session_state.gallery_limit = GALLERY_PAGE_SIZE
+                    merged_df_tweet = merged_df_tweet.head(st.session_state.gallery_limit)
+                    missing_link = merged_df_tweet['tweet_link'].isna()
+                    if missing_link.any():
+                        # rows classified before links were stored: look them up by author and post time
+                        window = tweets.window(selected_tags, start_datetime, end_datetime)
+                        window = window.filter(pc.is_in(window['username'], value_set=pa.array(merged_df_tweet.loc[missing_link, 'username'].unique().tolist(), pa.string())))
+                        links = window.select(['username', 'postTimeRaw', 'tweet_link']).to_pandas().set_index(['username', 'postTimeRaw'])['tweet_link']
+                        links = links[~links.index.duplicated()]
+                        merged_df_tweet.loc[missing_link, 'tweet_link'] = pd.MultiIndex.from_frame(
+                            merged_df_tweet.loc[missing_link, ['username', 'postTimeRaw']]
+                        ).map(links)
                     # st.write(merged_df_tweet)
-                    mid = nb_columns // 2
-                    order = []
-                    for i in range(nb_columns):
-                        if i % 2 == 0:
-                            order.append(mid + i // 2)
-                        else:
-                            order.append(mid - (i + 1) // 2)
-                    for index, tweet in merged_df_tweet.iterrows():
-                        col_index = order[index % nb_columns]
-                        postTimeRaw_text = str(tweet['postTimeRaw']).strip()
-                        tweetText_text = str(tweet['tweetText']).strip().replace('\n','<br>')
-                        tweet_link = str(tweet['tweet_link']).strip()
-                        with cols_info[col_index]:
-                            st.markdown(f"""
-                            <style>
-                            .box {{
-                                padding: 1em 1em 0 1em;
-                                border-radius: 15px;
-                                background-color: #FFFFFF;
-                                box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-                                transition: box-shadow 0.4s ease-in-out, transform 0.3s ease-in-out;
-                                display: flex;
-                                flex-direction: column;
-                                margin: 1em;
-                            }}
-                            .box:hover {{
-                                box-shadow: 0 12px 24px rgba(0, 0, 0, 0.2);
-                                transform: translateY(-4px);
-                            }}
-                            .logo {{
-                                padding-bottom: 1em;
-                                display: flex;
-                                justify-content: space-between;
-                            }}
-                            .info p{{
-                                text-align: left;
-                                padding-left: 2.5em;
-                                padding-right: 2.5em;
-                            }}
-                            .foot p{{
-                                opacity: 40%;
-                                text-align: right;
-                                margin-bottom: 0.7em;
-                            }}
-                            .xlink {{
-                                color: black;
-                                opacity: 40%;
-                                transition: opacity 0.2s ease-in-out;
-                            }}
-                            .xlink:hover {{
-                                color: black;
-                                opacity: 70%;
-                            }}
-                            </style>
-                            <div class="box">
-                                <div class="logo">
-                                    <svg width="20" height="20.7" viewBox="0 0 1200 1227" fill="none" xmlns="http://www.w3.org/2000/svg">
-                                        <path d="M714.163 519.284L1160.89 0H1055.03L667.137 450.887L357.328 0H0L468.492 681.821L0 1226.37H105.866L515.491 750.218L842.672 1226.37H1200L714.137 519.284H714.163ZM569.165 687.828L521.697 619.934L144.011 79.6944H306.615L611.412 515.685L658.88 583.579L1055.08 1150.3H892.476L569.165 687.854V687.828Z" fill="black"/>
-                                    </svg>
-                                    <a href="{tweet_link}" class="xlink" style="color: black;">x.com</a>
-                                </div>
-                                <div class="info">
-                                    <p>{tweetText_text}</p>
-                                </div>
-                                <div class="foot">
-                                    <p>{postTimeRaw_text}</p>
-                                </div>
-                            </div>
-                            """, unsafe_allow_html=True)
+                    tweet_gallery(merged_df_tweet)
+                    st.caption(f"{len(merged_df_tweet):,} / {len(filtered):,} tweets")
+                    if len(merged_df_tweet) < len(filtered):
+                        st.button("แสดงเพิ่ม", on_click=show_more_cards)
 
     else:
         st.markdown("<h1 style='opacity: 40%;text-align: center;'>Not Found</h1>", unsafe_allow_html=True)
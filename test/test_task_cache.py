@@ -0,0 +1,40 @@
+import pytest
+from prefect.settings import PREFECT_LOCAL_STORAGE_PATH
+from prefect.testing.utilities import prefect_test_harness
+
+# both flows declare their cached tasks at import time, which is where Prefect checks the options
+import src.backend.pipeline.initial_scrape_flow as initial_scrape_flow
+import src.backend.pipeline.incremental_scrape_flow as incremental_scrape_flow
+from src.backend.pipeline import task_cache
+
+
+@pytest.fixture(scope="module", autouse=True)
+def prefect_server():
+    with prefect_test_harness():
+        yield
+
+
+def test_flow_modules_use_the_content_cache():
+    for module in (initial_scrape_flow, incremental_scrape_flow):
+        assert isinstance(module.encode_tags.cache_policy, task_cache.Fingerprint)
+        assert module.encode_tags.result_storage is None
+
+
+def test_cached_task_runs_once_for_the_same_input(tmp_path, monkeypatch):
+    calls = []
+
+    def encode_tag_to_url(self, tags):
+        calls.append(tags)
+        return {category: {tag: f"https://x.com/search?q={tag}" for tag in tag_list} for category, tag_list in tags.items()}
+
+    monkeypatch.setattr(incremental_scrape_flow.XScraping, "encode_tag_to_url", encode_tag_to_url)
+    tags = {"category": ["#tag"]}
+    with task_cache.temporary_settings(updates={PREFECT_LOCAL_STORAGE_PATH: tmp_path}):
+        first = incremental_scrape_flow.encode_tags(tags, return_state=True)
+        second = incremental_scrape_flow.encode_tags(tags, return_state=True)
+
+    assert first.is_completed() and second.is_completed()
+    assert second.name == "Cached"
+    assert second.result() == first.result()
+    assert len(calls) == 1
+    assert any(tmp_path.iterdir())
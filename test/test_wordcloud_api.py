@@ -0,0 +1,35 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+# the API builds its classifier backend on import; the Gemini client only needs a key to exist
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from src.backend.ml import wordcloud_api
+
+
+def test_wordcloud_window_with_offset_is_compared_in_utc(monkeypatch):
+    counts = pd.DataFrame({
+        "tag": ["#tag"] * 3,
+        "bucket": pd.to_datetime(["2025-05-01 02:45", "2025-05-01 03:00", "2025-05-01 04:00"]),
+        "level": ["subtopic"] * 3,
+        "label": ["before", "inside", "after"],
+        "count": [1, 2, 4],
+    })
+    monkeypatch.setattr(wordcloud_api.pd, "read_parquet", lambda *args, **kwargs: counts)
+
+    # 10:00-10:30 in Bangkok is 03:00-03:30 UTC
+    bangkok = timezone(timedelta(hours=7))
+    words = wordcloud_api.wordcloud(
+        tags=["#tag"],
+        start=datetime(2025, 5, 1, 10, 0, tzinfo=bangkok),
+        end=datetime(2025, 5, 1, 10, 30, tzinfo=bangkok),
+    )
+
+    assert {word["name"]: word["value"] for word in words} == {"inside": 2}
+
+
+def test_naive_window_is_taken_as_utc():
+    assert wordcloud_api.naive_utc(datetime(2025, 5, 1, 3, 0)) == pd.Timestamp("2025-05-01 03:00")
+    assert wordcloud_api.naive_utc(datetime(2025, 5, 1, 3, 0, tzinfo=timezone.utc)) == pd.Timestamp("2025-05-01 03:00")